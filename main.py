@@ -6,40 +6,64 @@ Combina la funcionalidad de slice_images.py y puzzle_solver.py en un flujo autom
 
 import os
 import sys
-import subprocess
 import glob
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 def run_slice_images(image_path, num_slices):
     """
-    Ejecuta slice_images.py con los parámetros especificados
+    Ejecuta slice_image de slice_images.py en el mismo proceso
     """
     print("🔪 Iniciando división de imagen...")
     print("-" * 40)
     
     try:
-        # Ejecutar slice_images.py con argumentos
-        cmd = [sys.executable, "slice_images.py", image_path, str(num_slices)]
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        # Importar el módulo directamente (evita arrancar otro intérprete
+        # y volver a cargar OpenCV/NumPy)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import slice_images
         
-        print(result.stdout)
-        if result.stderr:
-            print("Advertencias:", result.stderr)
+        slice_images.slice_image(image_path, num_slices)
         
         print("✅ División completada exitosamente")
         return True
         
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Error durante la división: {e}")
-        if e.stdout:
-            print("Salida:", e.stdout)
-        if e.stderr:
-            print("Error:", e.stderr)
+    except ImportError as e:
+        print(f"❌ Error: No se pudo importar slice_images.py: {e}")
         return False
-    except FileNotFoundError:
-        print("❌ Error: No se encontró slice_images.py")
+    except Exception as e:
+        print(f"❌ Error durante la división: {e}")
         return False
 
+# Métodos de reconstrucción: nombre -> (módulo, clase).
+# Se resuelven por nombre dentro de cada proceso para no serializar las clases.
+SOLVERS = {
+    'gradient': ('gradient_reconstructor', 'GradientSolver'),
+    'color': ('color_reconstructor', 'ColorSolver'),
+    'random': ('random_reconstructor', 'RandomSolver')
+}
+
+def _run_solver(method_name, sliced_dir, output_dir, image_name):
+    """
+    Ejecuta un único método de reconstrucción.
+    Es una función de nivel superior para poder lanzarla en otro proceso.
+    """
+    import importlib
+    
+    # En un proceso 'spawn' el logging no hereda la configuración del padre
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'puzzle_reconstructor'))
+    module_name, class_name = SOLVERS[method_name]
+    solver_class = getattr(importlib.import_module(module_name), class_name)
+    
+    print(f"\n🔄 Ejecutando método: {method_name.upper()}")
+    solver = solver_class(sliced_dir, output_dir, image_name)
+    solver.load_slices(image_name)
+    solver.solve()
+    return method_name
+
 def run_puzzle_solver(image_name, num_slices, method='all'):
     """
     Ejecuta puzzle_solver.py con la configuración especificada
@@ -57,42 +81,42 @@ def run_puzzle_solver(image_name, num_slices, method='all'):
         # Crear manualmente los solvers con las rutas correctas
         print(f"📂 Usando carpeta de trozos: {sliced_dir}")
         
-        # Importar los módulos necesarios
-        sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'puzzle_reconstructor'))
-        from gradient_reconstructor import GradientSolver
-        from color_reconstructor import ColorSolver
-        from random_reconstructor import RandomSolver
-        
         output_dir = "output_images"
         
         # Ejecutar métodos según la selección
         if method == 'all':
-            methods_to_run = [
-                ('gradient', GradientSolver),
-                ('color', ColorSolver),
-                ('random', RandomSolver)
-            ]
+            methods_to_run = list(SOLVERS)
         else:
-            solver_map = {
-                'gradient': GradientSolver,
-                'color': ColorSolver,
-                'random': RandomSolver
-            }
-            if method not in solver_map:
+            if method not in SOLVERS:
                 print(f"❌ Error: Método desconocido '{method}'")
                 return False
-            methods_to_run = [(method, solver_map[method])]
+            methods_to_run = [method]
         
         success_count = 0
-        for method_name, solver_class in methods_to_run:
+        if len(methods_to_run) == 1:
+            # Un solo método: no compensa arrancar otro proceso
+            method_name = methods_to_run[0]
             try:
-                print(f"\n🔄 Ejecutando método: {method_name.upper()}")
-                solver = solver_class(sliced_dir, output_dir, image_name)
-                solver.load_slices(image_name)
-                solver.solve()
+                _run_solver(method_name, sliced_dir, output_dir, image_name)
                 success_count += 1
             except Exception as e:
                 print(f"❌ Error en método {method_name}: {e}")
+        else:
+            # Los métodos son independientes: se ejecutan en paralelo, un proceso por método.
+            # Se usa 'spawn' para evitar bloqueos de los hilos internos de OpenCV tras un fork.
+            ctx = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=len(methods_to_run), mp_context=ctx) as executor:
+                futures = {
+                    executor.submit(_run_solver, method_name, sliced_dir, output_dir, image_name): method_name
+                    for method_name in methods_to_run
+                }
+                for future in as_completed(futures):
+                    method_name = futures[future]
+                    try:
+                        future.result()
+                        success_count += 1
+                    except Exception as e:
+                        print(f"❌ Error en método {method_name}: {e}")
         
         if success_count > 0:
             print(f"\n✅ Reconstrucción completada: {success_count} métodos exitosos")
@@ -101,10 +125,6 @@ def run_puzzle_solver(image_name, num_slices, method='all'):
             print("❌ Todos los métodos fallaron")
             return False
         
-    except ImportError as e:
-        print(f"❌ Error de importación: {e}")
-        print("Verificar que los módulos puzzle_reconstructor están disponibles")
-        return False
     except Exception as e:
         print(f"❌ Error durante la reconstrucción: {e}")
         return False
@@ -120,7 +140,7 @@ def validate_image_exists(image_path):
         return False
     
     # Verificar que sea un archivo de imagen válido
-    valid_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
+    valid_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp']
     ext = Path(image_path).suffix.lower()
     
     if ext not in valid_extensions:
@@ -133,7 +153,7 @@ def validate_image_exists(image_path):
 def validate_num_slices(num_slices):
     """Valida que el número de slices tenga raíz cuadrada exacta"""
     import math
-    sqrt_slices = int(math.sqrt(num_slices))
+    sqrt_slices = math.isqrt(num_slices)
     if sqrt_slices * sqrt_slices != num_slices:
         print(f"❌ Error: {num_slices} no tiene raíz cuadrada exacta")
         print(f"Números válidos: 4, 9, 16, 25, 36, 49, 64, 81, 100, etc.")
@@ -270,6 +290,7 @@ def main():
     print("\n✨ ¡Revisa los resultados y compara los diferentes métodos!")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
     try:
         main()
     except KeyboardInterrupt:
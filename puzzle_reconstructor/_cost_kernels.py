@@ -0,0 +1,87 @@
+"""
+Kernels compilados con Numba para construir las matrices de coste (N, N).
+
+Recorren los pares de bordes sin reservar el temporal (N, N, L, ...) que
+necesita la versión con NumPy y reparten las filas entre los núcleos.
+Este módulo solo se importa si Numba está instalado; los solvers vuelven
+a la versión con NumPy en caso contrario.
+"""
+import numpy as np
+from numba import njit, prange
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def color_cost_matrix(edges_a, edges_b):
+    """
+    C[i, j] = media a lo largo del borde de sum_c |edges_a[i, k, c] - edges_b[j, k, c]|
+    edges_a, edges_b: arrays (N, L, 3) de enteros (LAB)
+    """
+    n_a, length, channels = edges_a.shape
+    n_b = edges_b.shape[0]
+    out = np.empty((n_a, n_b), dtype=np.float64)
+
+    for i in prange(n_a):
+        for j in range(n_b):
+            total = 0
+            for k in range(length):
+                for c in range(channels):
+                    total += abs(int(edges_a[i, k, c]) - int(edges_b[j, k, c]))
+            out[i, j] = total / length
+    return out
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def gradient_cost_matrix(edges_a, edges_b):
+    """
+    C[i, j] = media a lo largo del borde de |edges_a[i, k] - edges_b[j, k]|
+    edges_a, edges_b: arrays (N, L) de magnitudes de gradiente
+    """
+    n_a, length = edges_a.shape
+    n_b = edges_b.shape[0]
+    out = np.empty((n_a, n_b), dtype=np.float64)
+
+    for i in prange(n_a):
+        for j in range(n_b):
+            total = 0.0
+            for k in range(length):
+                total += abs(edges_a[i, k] - edges_b[j, k])
+            out[i, j] = total / length
+    return out
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def color_cost_pairs(edges_a, edges_b, idx_a, idx_b):
+    """
+    Igual que color_cost_matrix, pero solo para los pares (idx_a[p], idx_b[p]).
+    Se usa para recalcular con los bordes completos una lista de candidatos.
+    """
+    n_pairs = idx_a.shape[0]
+    length, channels = edges_a.shape[1], edges_a.shape[2]
+    out = np.empty(n_pairs, dtype=np.float64)
+
+    for p in prange(n_pairs):
+        i, j = idx_a[p], idx_b[p]
+        total = 0
+        for k in range(length):
+            for c in range(channels):
+                total += abs(int(edges_a[i, k, c]) - int(edges_b[j, k, c]))
+        out[p] = total / length
+    return out
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def gradient_cost_pairs(edges_a, edges_b, idx_a, idx_b):
+    """
+    Igual que gradient_cost_matrix, pero solo para los pares (idx_a[p], idx_b[p]).
+    """
+    n_pairs = idx_a.shape[0]
+    length = edges_a.shape[1]
+    out = np.empty(n_pairs, dtype=np.float64)
+
+    for p in prange(n_pairs):
+        i, j = idx_a[p], idx_b[p]
+        total = 0.0
+        for k in range(length):
+            total += abs(edges_a[i, k] - edges_b[j, k])
+        out[p] = total / length
+    return out
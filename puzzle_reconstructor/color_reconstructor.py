@@ -2,52 +2,123 @@ import cv2
 import numpy as np
 import os
 import sys
+from typing import Optional
 
 # Asegurar que se puede importar puzzle_base desde el mismo directorio
 sys.path.insert(0, os.path.dirname(__file__))
 
-from puzzle_base import PuzzleSolverBase
+from puzzle_base import PuzzleSolverBase, NUMBA_MIN_ELEMENTS
+
+def _color_cost_matrix(edges_a: np.ndarray, edges_b: np.ndarray) -> np.ndarray:
+    """
+    Suma de diferencias absolutas (L1) entre los colores (L, a, b) de cada
+    píxel del borde, promediada a lo largo del borde. Es una métrica distinta
+    de la distancia Euclidiana (puede ordenar los candidatos de otra forma),
+    elegida porque es más barata de calcular.
+    Con SciPy es la distancia 'cityblock' de cdist sobre los bordes aplanados,
+    que no reserva el temporal (N, N, H, 3).
+    """
+    try:
+        from scipy.spatial.distance import cdist
+    except ImportError:
+        return np.abs(edges_a[:, None] - edges_b[None, :]).sum(axis=-1).mean(axis=-1)
+    
+    return cdist(edges_a.reshape(len(edges_a), -1), edges_b.reshape(len(edges_b), -1),
+                 'cityblock') / edges_a.shape[1]
+
+def _color_cost_pairs(edges_a: np.ndarray, edges_b: np.ndarray,
+                      idx_a: np.ndarray, idx_b: np.ndarray) -> np.ndarray:
+    """Misma distancia que _color_cost_matrix, solo para los pares indicados."""
+    return np.abs(edges_a[idx_a] - edges_b[idx_b]).sum(axis=-1).mean(axis=-1)
 
 class ColorSolver(PuzzleSolverBase):
-    def __init__(self, sliced_dir: str, output_dir: str, image_name: str = ""):
-        super().__init__(sliced_dir, output_dir, image_name)
+    def __init__(self, sliced_dir: str, output_dir: str, image_name: str = "", keep_images: Optional[bool] = None,
+                 rows: Optional[int] = None, cols: Optional[int] = None,
+                 shortlist_k: Optional[int] = None):
+        super().__init__(sliced_dir, output_dir, image_name, keep_images, rows, cols, shortlist_k)
     
     def extract_features(self, img: np.ndarray):
         """
         Convierte a espacio de color LAB.
         L = Luminosidad, a/b = canales de color.
         Es mucho mejor que RGB para comparar similitud visual.
+        Solo se guarda la fila/columna de contacto de cada lado, (W, 3) o (H, 3),
+        en int16 (LAB de OpenCV es uint8) para poder restarlas sin desbordamiento.
         """
-        lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB).astype(np.float32)
-        w_b = self.border_width
+        lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
         
         return {
-            'top': lab[0:w_b, :, :],
-            'bottom': lab[-w_b:, :, :],
-            'left': lab[:, 0:w_b, :],
-            'right': lab[:, -w_b:, :]
+            'top': lab[0, :, :].astype(np.int16),
+            'bottom': lab[-1, :, :].astype(np.int16),
+            'left': lab[:, 0, :].astype(np.int16),
+            'right': lab[:, -1, :].astype(np.int16)
         }
 
-    def calculate_cost(self, idx_a: int, idx_b: int, direction: str) -> float:
-        """Calcula la distancia de color entre los bordes de contacto."""
-        feats_a = self.slices[idx_a].borders
-        feats_b = self.slices[idx_b].borders
+    def extract_features_batch(self, images):
+        """
+        Igual que extract_features, pero para todos los trozos a la vez.
+        La conversión a LAB es píxel a píxel, así que basta con apilar las
+        filas/columnas de contacto de todos los trozos y convertirlas con una
+        única llamada a OpenCV.
+        """
+        if len({img.shape for img in images}) != 1:
+            return super().extract_features_batch(images)
+        
+        stack = np.stack(images)  # (N, H, W, 3)
+        n, h, w = stack.shape[:3]
+        edges = np.concatenate([stack[:, 0], stack[:, -1], stack[:, :, 0], stack[:, :, -1]], axis=1)
+        lab = cv2.cvtColor(edges, cv2.COLOR_BGR2LAB).astype(np.int16)  # (N, 2W + 2H, 3)
         
+        top, bottom, left, right = np.split(lab, [w, 2 * w, 2 * w + h], axis=1)
+        return [{'top': top[i], 'bottom': bottom[i], 'left': left[i], 'right': right[i]}
+                for i in range(n)]
+
+    def calculate_cost_matrix(self, direction: str) -> np.ndarray:
+        """
+        Calcula de una vez la matriz (N, N) de distancia de color entre los
+        bordes de contacto de todos los pares de trozos.
+        """
+        # Bordes de contacto apilados: (N, H, 3) en horizontal, (N, W, 3) en vertical
+        # ((N, S, 3) si se usan firmas)
+        edges_a, edges_b = self.contact_edges(direction)
+        
+        cost_matrix = _color_cost_matrix
+        if len(self.slices) ** 2 * edges_a[0].size >= NUMBA_MIN_ELEMENTS:
+            # Puzzle grande: con Numba no se reserva el temporal (N, N, H, 3)
+            try:
+                from _cost_kernels import color_cost_matrix as cost_matrix
+            except ImportError:
+                pass
+        
+        return cost_matrix(edges_a, edges_b)
+
+    def calculate_cost_pairs(self, direction: str, idx_a: np.ndarray, idx_b: np.ndarray) -> np.ndarray:
+        """Coste con los bordes completos solo para los pares (idx_a[p], idx_b[p])."""
+        edges_a, edges_b = self.contact_edges(direction, signatures=False)
+        
+        cost_pairs = _color_cost_pairs
+        if len(idx_a) * edges_a[0].size >= NUMBA_MIN_ELEMENTS:
+            # Muchos pares: con Numba no se reserva el temporal (P, H, 3)
+            try:
+                from _cost_kernels import color_cost_pairs as cost_pairs
+            except ImportError:
+                pass
+        
+        return cost_pairs(edges_a, edges_b, np.asarray(idx_a, dtype=np.intp), np.asarray(idx_b, dtype=np.intp))
+
+    def calculate_cost(self, idx_a: int, idx_b: int, direction: str) -> float:
+        """Devuelve la distancia de color precalculada entre los bordes de contacto."""
+        cost_h, cost_v = self._ensure_cost_matrices()
         if direction == 'horizontal':
-            edge_a = feats_a['right'][:, -1]
-            edge_b = feats_b['left'][:, 0]
-        else: # vertical
-            edge_a = feats_a['bottom'][-1, :]
-            edge_b = feats_b['top'][0, :]
-            
-        # Distancia Euclidiana entre los vectores de color (L, a, b)
-        # axis=1 porque shape es (N, 3)
-        diff = np.linalg.norm(edge_a - edge_b, axis=1)
-        return np.mean(diff)
+            return cost_h[idx_a, idx_b]
+        return cost_v[idx_a, idx_b]
 
 if __name__ == "__main__":
+    import logging
     import sys
     
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+    
     # Usar argumento de línea de comandos o pedir al usuario
     if len(sys.argv) > 1:
         NOMBRE_BASE = sys.argv[1]
@@ -2,15 +2,53 @@ import cv2
 import numpy as np
 import os
 import sys
+from typing import Optional
 
 # Asegurar que se puede importar puzzle_base desde el mismo directorio
 sys.path.insert(0, os.path.dirname(__file__))
 
-from puzzle_base import PuzzleSolverBase
+from puzzle_base import PuzzleSolverBase, NUMBA_MIN_ELEMENTS
+
+def _gradient_cost_matrix(edges_a: np.ndarray, edges_b: np.ndarray) -> np.ndarray:
+    """
+    Diferencia absoluta media entre los gradientes de cada par de bordes.
+    Con SciPy se calcula con cdist ('cityblock'), sin el temporal (N, N, H).
+    """
+    try:
+        from scipy.spatial.distance import cdist
+    except ImportError:
+        return np.abs(edges_a[:, None] - edges_b[None, :]).mean(axis=-1)
+    
+    return cdist(edges_a, edges_b, 'cityblock') / edges_a.shape[1]
+
+def _gradient_cost_pairs(edges_a: np.ndarray, edges_b: np.ndarray,
+                         idx_a: np.ndarray, idx_b: np.ndarray) -> np.ndarray:
+    """Misma diferencia que _gradient_cost_matrix, solo para los pares indicados."""
+    return np.abs(edges_a[idx_a] - edges_b[idx_b]).mean(axis=-1)
+
+def _edge_magnitude(strips: np.ndarray) -> np.ndarray:
+    """
+    Magnitud de Scharr en la primera fila de cada tira (N, 2, L), en float16.
+    Cada tira se rodea de 1 píxel reflejado (el borde por defecto de Scharr)
+    para que apilarlas no mezcle trozos y el resultado sea idéntico al de
+    aplicar Scharr a cada trozo completo.
+    """
+    n, _, length = strips.shape
+    padded = np.pad(strips, ((0, 0), (1, 1), (1, 1)), mode='reflect').reshape(n * 4, length + 2)
+    grad_x = cv2.Scharr(padded, cv2.CV_32F, 1, 0)
+    grad_y = cv2.Scharr(padded, cv2.CV_32F, 0, 1)
+    magnitude = cv2.magnitude(grad_x, grad_y).reshape(n, 4, length + 2)
+    return magnitude[:, 1, 1:-1].astype(np.float16)
 
 class GradientSolver(PuzzleSolverBase):
-    def __init__(self, sliced_dir: str, output_dir: str, image_name: str = ""):
-        super().__init__(sliced_dir, output_dir, image_name)
+    # Las firmas promediadas suavizan los picos de gradiente: con shortlist_k
+    # solo la mitad de los mejores candidatos exactos sobreviven a la preselección
+    shortlist_supported = False
+    
+    def __init__(self, sliced_dir: str, output_dir: str, image_name: str = "", keep_images: Optional[bool] = None,
+                 rows: Optional[int] = None, cols: Optional[int] = None,
+                 shortlist_k: Optional[int] = None):
+        super().__init__(sliced_dir, output_dir, image_name, keep_images, rows, cols, shortlist_k)
     
     def extract_features(self, img: np.ndarray):
         """
@@ -19,41 +57,96 @@ class GradientSolver(PuzzleSolverBase):
         """
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         
-        # Sobel para detectar cambios de intensidad (bordes)
-        grad_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
-        grad_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
+        # Scharr (3x3, más simétrico que Sobel y con ruta optimizada en OpenCV)
+        # para detectar cambios de intensidad (bordes).
+        # float32 basta para la magnitud y reduce a la mitad la memoria movida
+        grad_x = cv2.Scharr(gray, cv2.CV_32F, 1, 0)
+        grad_y = cv2.Scharr(gray, cv2.CV_32F, 0, 1)
         magnitude = cv2.magnitude(grad_x, grad_y)
         
-        w_b = self.border_width
+        # Solo se guarda la fila/columna de contacto de cada lado (copia
+        # contigua, para no retener el mapa de gradiente completo), en float16:
+        # la mitad de memoria para los bordes; los costes se calculan en float32
         return {
-            'top': magnitude[0:w_b, :],
-            'bottom': magnitude[-w_b:, :],
-            'left': magnitude[:, 0:w_b],
-            'right': magnitude[:, -w_b:]
+            'top': magnitude[0, :].astype(np.float16),
+            'bottom': magnitude[-1, :].astype(np.float16),
+            'left': magnitude[:, 0].astype(np.float16),
+            'right': magnitude[:, -1].astype(np.float16)
         }
 
+    def extract_features_batch(self, images):
+        """
+        Igual que extract_features, pero para todos los trozos a la vez.
+        Solo se necesita el gradiente en la fila/columna de contacto, que con
+        Scharr 3x3 depende únicamente de esa fila/columna y de la contigua.
+        Se apilan esas tiras de todos los trozos y se procesan con una única
+        llamada a Scharr por lado.
+        """
+        if len({img.shape for img in images}) != 1:
+            return super().extract_features_batch(images)
+        
+        stack = np.stack(images)  # (N, H, W, 3)
+        n, h, w = stack.shape[:3]
+        gray = cv2.cvtColor(stack.reshape(n * h, w, 3), cv2.COLOR_BGR2GRAY).reshape(n, h, w)
+        
+        # Tiras (N, 2, L): fila/columna de contacto seguida de la contigua.
+        # Trasponer o invertir una tira solo intercambia o cambia de signo
+        # grad_x/grad_y, así que la magnitud no cambia.
+        top = _edge_magnitude(gray[:, 0:2, :])
+        bottom = _edge_magnitude(gray[:, [-1, -2], :])
+        left = _edge_magnitude(gray[:, :, 0:2].transpose(0, 2, 1))
+        right = _edge_magnitude(gray[:, :, [-1, -2]].transpose(0, 2, 1))
+        return [{'top': top[i], 'bottom': bottom[i], 'left': left[i], 'right': right[i]}
+                for i in range(n)]
+
+    def calculate_cost_matrix(self, direction: str) -> np.ndarray:
+        """
+        Calcula de una vez la matriz (N, N) de diferencia de gradiente en la
+        frontera para todos los pares de trozos.
+        """
+        # Los bordes se guardan en float16; se operan en float32 para no perder precisión
+        edges_a, edges_b = (edges.astype(np.float32) for edges in self.contact_edges(direction))
+        
+        cost_matrix = _gradient_cost_matrix
+        if len(self.slices) ** 2 * edges_a[0].size >= NUMBA_MIN_ELEMENTS:
+            # Puzzle grande: con Numba no se reserva el temporal (N, N, H)
+            try:
+                from _cost_kernels import gradient_cost_matrix as cost_matrix
+            except ImportError:
+                pass
+        
+        return cost_matrix(edges_a, edges_b)
+
+    def calculate_cost_pairs(self, direction: str, idx_a: np.ndarray, idx_b: np.ndarray) -> np.ndarray:
+        """Coste con los bordes completos solo para los pares (idx_a[p], idx_b[p])."""
+        edges_a, edges_b = (edges.astype(np.float32) for edges in self.contact_edges(direction, signatures=False))
+        
+        cost_pairs = _gradient_cost_pairs
+        if len(idx_a) * edges_a[0].size >= NUMBA_MIN_ELEMENTS:
+            # Muchos pares: con Numba no se reserva el temporal (P, H)
+            try:
+                from _cost_kernels import gradient_cost_pairs as cost_pairs
+            except ImportError:
+                pass
+        
+        return cost_pairs(edges_a, edges_b, np.asarray(idx_a, dtype=np.intp), np.asarray(idx_b, dtype=np.intp))
+
     def calculate_cost(self, idx_a: int, idx_b: int, direction: str) -> float:
         """
         Compara los píxeles de gradiente en la frontera.
         Si las líneas continúan, la diferencia de gradiente debe ser baja.
         """
-        feats_a = self.slices[idx_a].borders
-        feats_b = self.slices[idx_b].borders
-        
+        cost_h, cost_v = self._ensure_cost_matrices()
         if direction == 'horizontal':
-            # Borde derecho de A (última columna) vs Izquierdo de B (primera columna)
-            edge_a = feats_a['right'][:, -1]
-            edge_b = feats_b['left'][:, 0]
-        else: # vertical
-            # Borde inferior de A (última fila) vs Superior de B (primera fila)
-            edge_a = feats_a['bottom'][-1, :]
-            edge_b = feats_b['top'][0, :]
-            
-        return np.mean(np.abs(edge_a - edge_b))
+            return cost_h[idx_a, idx_b]
+        return cost_v[idx_a, idx_b]
 
 if __name__ == "__main__":
+    import logging
     import sys
     
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+    
     # Usar argumento de línea de comandos o pedir al usuario
     if len(sys.argv) > 1:
         NOMBRE_BASE = sys.argv[1]
@@ -1,35 +1,154 @@
 import os
 import glob
-import math
+import functools
+import heapq
+import json
+import logging
+import struct
+import warnings
 import cv2
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
+
+# Tamaño (en elementos) del temporal de broadcasting de una matriz de coste
+# a partir del cual se usan los kernels de Numba, si está instalado
+NUMBA_MIN_ELEMENTS = 1 << 24
+
+# Trozos que se decodifican a la vez en load_slices cuando no se guardan
+# las imágenes: limita el pico de memoria en puzzles grandes
+LOAD_CHUNK_SIZE = 256
+
+# Con keep_images=None, las imágenes se guardan en memoria si todos los
+# trozos juntos ocupan como mucho esto (bytes); si no, se releen al guardar
+KEEP_IMAGES_MAX_BYTES = 256 << 20
+
+# Muestras de las firmas de borde con las que se preselecciona la lista corta
+# de candidatos cuando se usa shortlist_k
+SHORTLIST_SIGNATURE_LENGTH = 16
+
+log = logging.getLogger(__name__)
+
+@functools.lru_cache(maxsize=16)
+def _build_indexers(rows: int, cols: int) -> Tuple[np.ndarray, ...]:
+    """
+    Tablas para un grid rows x cols con las posiciones en orden de filas.
+    Para cada posición devuelve la posición de su vecino izquierdo, superior,
+    derecho e inferior (-1 si no hay), y su índice en orden Z (Morton), que
+    desempata el recorrido del relleno greedy.
+    Se calculan una sola vez por tamaño de puzzle.
+    """
+    positions = np.arange(rows * cols, dtype=np.int32)
+    r, c = positions // cols, positions % cols
+    left = np.where(c > 0, positions - 1, -1).astype(np.int32)
+    top = np.where(r > 0, positions - cols, -1).astype(np.int32)
+    right = np.where(c < cols - 1, positions + 1, -1).astype(np.int32)
+    bottom = np.where(r < rows - 1, positions + cols, -1).astype(np.int32)
+    
+    # Orden Z: se intercalan los bits de fila y columna
+    z_order = np.zeros(rows * cols, dtype=np.int64)
+    for bit in range(max(rows, cols).bit_length()):
+        z_order |= ((c >> bit) & 1).astype(np.int64) << (2 * bit)
+        z_order |= ((r >> bit) & 1).astype(np.int64) << (2 * bit + 1)
+    
+    tables = (left, top, right, bottom, z_order)
+    for table in tables:
+        table.setflags(write=False)
+    return tables
+
+def _png_size(path: str) -> Optional[Tuple[int, int]]:
+    """(alto, ancho) de un PNG leídos de su cabecera IHDR, sin decodificarlo."""
+    with open(path, 'rb') as f:
+        head = f.read(24)
+    if len(head) < 24 or head[:8] != b'\x89PNG\r\n\x1a\n':
+        return None
+    width, height = struct.unpack('>II', head[16:24])
+    return height, width
 
 @dataclass
 class ImageSlice:
     id: int
     filename: str
-    image: np.ndarray
+    # None si el solver no guarda las imágenes (se releen de path al guardar)
+    image: Optional[np.ndarray]
     # Características (bordes) para el análisis
     borders: Dict[str, np.ndarray] 
+    path: str = ""
 
 class PuzzleSolverBase:
-    def __init__(self, sliced_dir: str, output_dir: str, image_name: str = ""):
+    # Cachés compartidas por todas las instancias del proceso, indexadas por
+    # (ruta, mtime) del trozo. Evitan volver a decodificar los PNG y a recalcular
+    # LAB/gradientes cuando se ejecutan varios métodos seguidos sobre los mismos
+    # trozos (modo 'all' de puzzle_solver.py). Solo guardan los trozos del
+    # último puzzle cargado. Las imágenes solo se guardan si el solver las
+    # conserva (keep_images, por defecto en puzzles de hasta
+    # KEEP_IMAGES_MAX_BYTES) y son vistas del tensor self.images del solver,
+    # así que no duplican memoria.
+    _image_cache: Dict[Tuple[str, int], np.ndarray] = {}
+    _features_cache: Dict[Tuple[str, int, str, int], Dict[str, np.ndarray]] = {}
+    # Las subclases que no comparan bordes (RandomSolver) lo ponen a False:
+    # load_slices no extrae ni apila características
+    needs_features = True
+    # Las subclases cuyas firmas de borde no conservan el orden de los
+    # candidatos lo ponen a False: shortlist_k se ignora y se usa el coste exacto
+    shortlist_supported = True
+
+    def __init__(self, sliced_dir: str, output_dir: str, image_name: str = "", keep_images: Optional[bool] = None,
+                 rows: Optional[int] = None, cols: Optional[int] = None,
+                 shortlist_k: Optional[int] = None):
         self.sliced_dir = sliced_dir
         self.output_dir = output_dir
         self.image_name = image_name
+        # Forma del grid; si no se indica se deduce de la geometría (grid_shape)
+        self.rows = rows
+        self.cols = cols
+        # Si es False, tras extraer los bordes se descartan las imágenes y
+        # save_results las vuelve a leer de disco para componer el lienzo.
+        # Con None se decide en load_slices según KEEP_IMAGES_MAX_BYTES
+        self.keep_images = keep_images
+        for name, value in (('rows', rows), ('cols', cols)):
+            if value is not None and value < 1:
+                raise ValueError(f"{name} debe ser un entero positivo: {value}")
+        if shortlist_k is not None and shortlist_k < 1:
+            raise ValueError(f"shortlist_k debe ser un entero positivo: {shortlist_k}")
+        if shortlist_k and not self.shortlist_supported:
+            log.warning("[%s] no admite shortlist_k; se usa el coste exacto", self.__class__.__name__)
+            shortlist_k = None
         self.slices: List[ImageSlice] = []
         self.border_width = 10  # Ancho del borde a analizar (10 píxeles)
+        # Matrices de coste (N, N) entre bordes, si la subclase las precalcula
+        self._cost_h: Optional[np.ndarray] = None
+        self._cost_v: Optional[np.ndarray] = None
+        # Si se indica, los costes se calculan sobre firmas de los bordes con
+        # este número de muestras en vez de sobre el borde completo
+        self.signature_length: Optional[int] = SHORTLIST_SIGNATURE_LENGTH if shortlist_k else None
+        # Si se indica, las matrices se calculan sobre las firmas y solo los
+        # shortlist_k mejores candidatos de cada trozo se recalculan con el
+        # borde completo (más rápido en puzzles grandes, menos exacto)
+        self.shortlist_k = shortlist_k
+        # Estructura de arrays tras load_slices: un tensor (N, ...) por lado y
+        # uno con todas las imágenes, indexados por ImageSlice.id
+        self.images: Optional[np.ndarray] = None
+        self.borders_top: Optional[np.ndarray] = None
+        self.borders_bottom: Optional[np.ndarray] = None
+        self.borders_left: Optional[np.ndarray] = None
+        self.borders_right: Optional[np.ndarray] = None
+        # (alto, ancho) de los trozos, para deducir la forma del grid
+        self.slice_shape: Optional[Tuple[int, int]] = None
 
     def extract_features(self, img: np.ndarray) -> Dict[str, np.ndarray]:
-        """Extrae los bordes para el análisis. Puede ser sobrescrito."""
+        """
+        Extrae los bordes para el análisis. Puede ser sobrescrito.
+        Se devuelven como copias float32 contiguas para no retener la imagen
+        ni repetir la conversión de uint8 en cada comparación.
+        """
         w_b = self.border_width
         return {
-            'top': img[0:w_b, :],
-            'bottom': img[-w_b:, :],
-            'left': img[:, 0:w_b],
-            'right': img[:, -w_b:]
+            'top': np.ascontiguousarray(img[0:w_b, :], dtype=np.float32),
+            'bottom': np.ascontiguousarray(img[-w_b:, :], dtype=np.float32),
+            'left': np.ascontiguousarray(img[:, 0:w_b], dtype=np.float32),
+            'right': np.ascontiguousarray(img[:, -w_b:], dtype=np.float32)
         }
 
     def load_slices(self, original_name_pattern: str):
@@ -37,113 +156,365 @@ class PuzzleSolverBase:
         # Busca archivos con el patrón: nombre_slice_XXX.png en la carpeta específica
         search_pattern = os.path.join(self.sliced_dir, f"{original_name_pattern}_slice_*.png")
         
-        # Ordenamos numéricamente para procesarlos en orden
-        try:
-            files = sorted(glob.glob(search_pattern), 
-                          key=lambda x: int(x.split('_slice_')[1].split('.')[0]))
-        except IndexError:
-            # Fallback por si el nombre no sigue el formato exacto
-            files = sorted(glob.glob(search_pattern))
+        # Los nombres que genera slice_images.py son deterministas (_slice_000, _001, ...),
+        # así que se generan en orden y se comprueban contra un único listado de la carpeta
+        existing = set(os.listdir(self.sliced_dir)) if os.path.isdir(self.sliced_dir) else set()
+        prefix = f"{original_name_pattern}_slice_"
+        n_matching = sum(1 for name in existing if name.startswith(prefix) and name.endswith('.png'))
+        files = []
+        while True:
+            filename = f"{prefix}{len(files):03d}.png"
+            if filename not in existing:
+                break
+            files.append(os.path.join(self.sliced_dir, filename))
+        
+        if len(files) != n_matching:
+            # Fallback si falta algún índice o los nombres no siguen el formato
+            # exacto: ordenamos numéricamente para procesarlos en orden
+            try:
+                files = sorted(glob.glob(search_pattern), 
+                              key=lambda x: int(x.split('_slice_')[1].split('.')[0]))
+            except (IndexError, ValueError):
+                files = sorted(glob.glob(search_pattern))
         
         if not files:
             raise FileNotFoundError(f"No se encontraron imágenes en: {search_pattern}")
             
-        print(f"[{self.__class__.__name__}] Cargando {len(files)} trozos desde {self.sliced_dir}...")
+        log.info("[%s] Cargando %d trozos desde %s...", self.__class__.__name__, len(files), self.sliced_dir)
         
-        for idx, fpath in enumerate(files):
-            img = cv2.imread(fpath)
-            if img is None: continue
-            
-            features = self.extract_features(img)
-            self.slices.append(ImageSlice(idx, os.path.basename(fpath), img, features))
+        # Tamaño de los trozos desde la cabecera del primero: decide si compensa
+        # guardar las imágenes en vez de decodificarlas dos veces
+        size = _png_size(files[0])
+        if size is not None:
+            self.slice_shape = size
+        if self.keep_images is None:
+            self.keep_images = size is not None and size[0] * size[1] * 3 * len(files) <= KEEP_IMAGES_MAX_BYTES
+        
+        # 1. Leer los trozos en paralelo (cv2.imread libera el GIL al decodificar),
+        # por bloques, y extraer en un solo lote por bloque las características
+        # que no estén en caché. Sin keep_images, solo se decodifican los trozos
+        # cuyas características faltan y las imágenes se sueltan tras cada bloque.
+        keys = [(fpath, os.stat(fpath).st_mtime_ns) for fpath in files]
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for start in range(0, len(keys), LOAD_CHUNK_SIZE):
+                chunk = keys[start:start + LOAD_CHUNK_SIZE]
+                features_keys = [(self.__class__.__name__, self.border_width) + key for key in chunk]
+                features = [PuzzleSolverBase._features_cache.get(fkey) for fkey in features_keys]
+                
+                to_read = [i for i, f in enumerate(features)
+                           if (f is None and self.needs_features) or self.keep_images]
+                images = dict(zip(to_read, executor.map(self._read_slice, [chunk[i] for i in to_read])))
+                
+                if self.slice_shape is None:
+                    decoded = next((img for img in images.values() if img is not None), None)
+                    if decoded is not None:
+                        self.slice_shape = decoded.shape[:2]
+                
+                missing = [i for i in to_read
+                           if features[i] is None and images[i] is not None and self.needs_features]
+                if missing:
+                    batch = self.extract_features_batch([images[i] for i in missing])
+                    for i, borders in zip(missing, batch):
+                        # Bordes contiguos en memoria una sola vez, antes de los bucles O(N²)
+                        features[i] = {side: np.ascontiguousarray(b) for side, b in borders.items()}
+                        PuzzleSolverBase._features_cache[features_keys[i]] = features[i]
+                
+                for i, (fpath, _) in enumerate(chunk):
+                    img = images.get(i)
+                    if (self.needs_features and features[i] is None) or (self.keep_images and img is None):
+                        continue  # No se pudo leer el trozo
+                    # El id es la posición en self.slices (índice de las matrices de coste)
+                    self.slices.append(ImageSlice(len(self.slices), os.path.basename(fpath),
+                                                  img, features[i] or {}, fpath))
+        
+        if self.slice_shape is None and self.slices:
+            # Sin cabecera PNG legible ni trozos decodificados: basta con leer uno
+            self.slice_shape = cv2.imread(self.slices[0].path).shape[:2]
+        
+        # 2. Apilar bordes (e imágenes, si se guardan) para que el cálculo de costes
+        # y el lienzo lean tensores contiguos en lugar de recorrer la lista de trozos
+        if self.needs_features:
+            self.borders_top = np.stack([s.borders['top'] for s in self.slices])
+            self.borders_bottom = np.stack([s.borders['bottom'] for s in self.slices])
+            self.borders_left = np.stack([s.borders['left'] for s in self.slices])
+            self.borders_right = np.stack([s.borders['right'] for s in self.slices])
+        if self.keep_images:
+            self.images = self._shared_stack([s.image for s in self.slices])
+            for slc in self.slices:
+                # Cada trozo pasa a ser una vista del tensor, sin duplicar memoria
+                slc.image = self.images[slc.id]
+        
+        # 3. Las cachés se quedan solo con los trozos de este puzzle, y las
+        # imágenes como vistas del mismo tensor que usa el solver
+        current = set(keys)
+        PuzzleSolverBase._features_cache = {fkey: f for fkey, f in PuzzleSolverBase._features_cache.items()
+                                            if fkey[2:] in current}
+        mtimes = dict(keys)
+        PuzzleSolverBase._image_cache = ({(slc.path, mtimes[slc.path]): slc.image for slc in self.slices}
+                                         if self.keep_images else {})
+
+    @staticmethod
+    def _shared_stack(images: List[np.ndarray]) -> np.ndarray:
+        """
+        Apila las imágenes en un tensor (N, h, w, 3). Si ya son, en orden, las
+        filas de un mismo tensor (vistas sacadas de la caché por el solver
+        anterior), se reutiliza ese tensor en vez de copiarlo.
+        """
+        base = images[0].base
+        if (isinstance(base, np.ndarray) and base.ndim == 4 and len(base) == len(images)
+                and all(img.base is base and img.ctypes.data == base[i].ctypes.data
+                        for i, img in enumerate(images))):
+            return base
+        stacked = np.stack(images)
+        stacked.setflags(write=False)  # Compartido con la caché y otros solvers
+        return stacked
+
+    def _read_slice(self, key: Tuple[str, int]) -> Optional[np.ndarray]:
+        """
+        Lee un trozo identificado por (ruta, mtime), reutilizando la caché
+        compartida si ese mismo archivo ya se leyó en este proceso. La caché
+        se rellena al final de load_slices con vistas de self.images.
+        """
+        img = PuzzleSolverBase._image_cache.get(key)
+        if img is None:
+            img = cv2.imread(key[0])
+        return img
+
+    def extract_features_batch(self, images: List[np.ndarray]) -> List[Dict[str, np.ndarray]]:
+        """
+        Extrae las características de varios trozos a la vez.
+        Puede ser sobrescrito para procesar todo el lote con una sola llamada
+        a OpenCV; por defecto llama a extract_features para cada trozo.
+        """
+        return [self.extract_features(img) for img in images]
+
+    def contact_edges(self, direction: str, signatures: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Devuelve los bordes apilados que se tocan en la dirección dada: derecho/izquierdo
+        en horizontal, inferior/superior en vertical. Si signature_length
+        está definido (y signatures es True), se reducen antes a sus firmas.
+        """
+        if direction == 'horizontal':
+            edges_a, edges_b = self.borders_right, self.borders_left
+        else: # vertical
+            edges_a, edges_b = self.borders_bottom, self.borders_top
+        
+        if signatures and self.signature_length:
+            return self.border_signatures(edges_a), self.border_signatures(edges_b)
+        return edges_a, edges_b
+
+    def border_signatures(self, edges: np.ndarray) -> np.ndarray:
+        """
+        Reduce bordes apilados (N, L, ...) a firmas (N, S, ...) promediando
+        S tramos consecutivos del borde (S = signature_length). Se conserva el
+        tipo de dato, así que las firmas se comparan con la misma métrica que
+        los bordes completos moviendo L/S veces menos memoria.
+        """
+        length = edges.shape[1]
+        n_bins = min(self.signature_length, length)
+        starts = np.linspace(0, length, n_bins, endpoint=False).astype(np.intp)
+        counts = np.diff(np.append(starts, length)).reshape((-1,) + (1,) * (edges.ndim - 2))
+        
+        means = np.add.reduceat(edges.astype(np.float32), starts, axis=1) / counts
+        if np.issubdtype(edges.dtype, np.integer):
+            means = np.rint(means)
+        return np.ascontiguousarray(means, dtype=edges.dtype)
 
     def calculate_cost(self, idx_a: int, idx_b: int, direction: str) -> float:
         """Debe ser implementado por las subclases (Gradiente y Color)."""
         raise NotImplementedError
 
-    def find_top_left_corner(self, n_slices: int) -> int:
+    def calculate_cost_matrix(self, direction: str) -> np.ndarray:
         """
-        Encuentra la pieza que tiene peor coincidencia arriba y a la izquierda.
-        Esa pieza es probablemente la esquina superior izquierda.
+        Devuelve la matriz (N, N) con el coste de colocar el trozo b a la
+        derecha (horizontal) o debajo (vertical) del trozo a, en C[a, b].
+        Las subclases deben sobrescribirlo con una versión vectorizada. La
+        implementación por defecto llama a calculate_cost para cada par y
+        se mantiene solo por compatibilidad.
         """
-        max_min_cost = -1
-        best_candidate = 0
+        warnings.warn(
+            f"{self.__class__.__name__} no implementa calculate_cost_matrix; "
+            "calcular los costes par a par con calculate_cost está obsoleto",
+            DeprecationWarning, stacklevel=2)
+        n_slices = len(self.slices)
+        return np.array([[self.calculate_cost(a, b, direction) for b in range(n_slices)]
+                         for a in range(n_slices)], dtype=np.float64)
 
-        for i in range(n_slices):
-            # Mejor coste posible a su izquierda (si fuera >0 seria malo)
-            min_left = min([self.calculate_cost(j, i, 'horizontal') for j in range(n_slices) if i != j])
-            # Mejor coste posible arriba
-            min_top = min([self.calculate_cost(j, i, 'vertical') for j in range(n_slices) if i != j])
+    def calculate_cost_pairs(self, direction: str, idx_a: np.ndarray, idx_b: np.ndarray) -> np.ndarray:
+        """
+        Coste exacto (con los bordes completos) de colocar cada idx_b[p] a la
+        derecha o debajo de idx_a[p]. Sirve para recalcular solo una lista de
+        candidatos. Por defecto llama a calculate_cost para cada par.
+        """
+        return np.array([self.calculate_cost(a, b, direction) for a, b in zip(idx_a, idx_b)],
+                        dtype=np.float64)
+
+    def _ensure_cost_matrices(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Devuelve las matrices de coste (N, N) horizontal y vertical,
+        calculándolas con calculate_cost_matrix la primera vez. La diagonal
+        se pone a infinito: un trozo no puede ser vecino de sí mismo.
+        """
+        if self._cost_h is None:
+            self._cost_h = self._build_cost_matrix('horizontal')
+        if self._cost_v is None:
+            self._cost_v = self._build_cost_matrix('vertical')
+        return self._cost_h, self._cost_v
+
+    def _build_cost_matrix(self, direction: str) -> np.ndarray:
+        """
+        Calcula una matriz de coste con la diagonal a infinito. Con
+        shortlist_k, calculate_cost_matrix trabaja sobre las firmas de los
+        bordes y después se recalculan con el borde completo los k mejores
+        candidatos de cada fila (mejor b para cada a) y de cada columna (mejor
+        a para cada b), porque solve y find_top_left_corner leen en los dos
+        sentidos. El resto de entradas conserva el coste aproximado de las
+        firmas, elevado estrictamente por encima del peor coste exacto de su
+        fila y de su columna para que nunca se prefiera a un candidato de las listas.
+        """
+        cost = np.array(self.calculate_cost_matrix(direction), dtype=np.float64)
+        np.fill_diagonal(cost, np.inf)
+        
+        n_slices = len(self.slices)
+        if self.shortlist_k and self.shortlist_k < n_slices - 1:
+            k = self.shortlist_k
+            row_shortlist = np.argpartition(cost, k - 1, axis=1)[:, :k]  # (N, k): índices de columna
+            col_shortlist = np.argpartition(cost, k - 1, axis=0)[:k, :]  # (k, N): índices de fila
+            shortlisted = np.zeros(cost.shape, dtype=bool)
+            np.put_along_axis(shortlisted, row_shortlist, True, axis=1)
+            np.put_along_axis(shortlisted, col_shortlist, True, axis=0)
             
-            # Sumamos los costes mínimos. Cuanto más alto sea este valor, 
-            # menos se parece a ninguna otra pieza por esos lados.
-            corner_score = min_left + min_top
+            # Cada par de las dos listas se recalcula una sola vez
+            idx_a, idx_b = np.nonzero(shortlisted)
+            exact = np.full(cost.shape, -np.inf)
+            exact[idx_a, idx_b] = self.calculate_cost_pairs(direction, idx_a, idx_b)
             
-            if corner_score > max_min_cost:
-                max_min_cost = corner_score
-                best_candidate = i
+            row_worst = np.take_along_axis(exact, row_shortlist, axis=1).max(axis=1)
+            col_worst = np.take_along_axis(exact, col_shortlist, axis=0).max(axis=0)
+            floor = np.nextafter(np.maximum(row_worst[:, None], col_worst[None, :]), np.inf)
+            cost = np.where(shortlisted, exact, np.maximum(cost, floor))
+        return cost
+
+    def grid_shape(self, n_slices: int) -> Tuple[int, int]:
+        """
+        Devuelve (filas, columnas) del puzzle. Si no se indicaron al crear el
+        solver, se elige el par de divisores de n_slices cuya relación de
+        aspecto (cols*w)/(rows*h) más se acerca a la de la imagen original,
+        leída del archivo de orden de slice_images.py, o a la de un trozo si
+        no está disponible.
+        """
+        if self.rows and self.cols:
+            if self.rows * self.cols != n_slices:
+                raise ValueError(f"El grid {self.rows}x{self.cols} no encaja con {n_slices} trozos")
+            return self.rows, self.cols
+        if self.rows or self.cols:
+            known = self.rows or self.cols
+            if n_slices % known:
+                raise ValueError(f"{n_slices} trozos no se pueden repartir en {known} filas/columnas")
+            return (known, n_slices // known) if self.rows else (n_slices // known, known)
+        
+        h, w = self.slice_shape
+        target_aspect = self._original_aspect() or w / h
+        pairs = [(r, n_slices // r) for r in range(1, n_slices + 1) if n_slices % r == 0]
+        return min(pairs, key=lambda rc: abs((rc[1] * w) / (rc[0] * h) - target_aspect))
+
+    def _original_aspect(self) -> Optional[float]:
+        """Relación ancho/alto de la imagen original según el archivo de orden, si existe."""
+        # Primero la copia JSON del archivo de orden, si slice_images.py la generó
+        json_path = os.path.join(self.sliced_dir, f"{self.image_name}_order.json")
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                order = json.load(f)
+            return order['width'] / order['height']
+        except (OSError, ValueError, KeyError, TypeError, ZeroDivisionError):
+            pass
         
-        return best_candidate
+        order_path = os.path.join(self.sliced_dir, f"{self.image_name}_order.txt")
+        try:
+            with open(order_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.startswith("Imagen original:"):
+                        width, height = line.split(":")[1].split()[0].split("x")
+                        return int(width) / int(height)
+        except (OSError, ValueError, IndexError):
+            pass
+        return None
+
+    def find_top_left_corner(self, n_slices: int) -> int:
+        """
+        Encuentra la pieza que tiene peor coincidencia arriba y a la izquierda.
+        Esa pieza es probablemente la esquina superior izquierda.
+        """
+        cost_h, cost_v = self._ensure_cost_matrices()
+        
+        # Columna i: coste de cada pieza j colocada a la izquierda / encima de i.
+        # Sumamos los mejores costes posibles por esos dos lados. Cuanto más alto
+        # sea este valor, menos se parece a ninguna otra pieza por esos lados.
+        corner_scores = cost_h.min(axis=0) + cost_v.min(axis=0)
+        return int(corner_scores.argmax())
 
     def solve(self):
         """Algoritmo Greedy automático para reconstruir el puzzle."""
         n_slices = len(self.slices)
-        side = int(math.sqrt(n_slices))
-        rows, cols = side, side
-        
-        # Si no es cuadrado perfecto, intentamos ajustar (ej. 2x3 para 6 piezas)
-        if rows * cols != n_slices:
-            # Lógica simple: si no es cuadrado, asumimos que es ancho
-            # Esto se puede mejorar si conoces las dimensiones
-            pass 
+        rows, cols = self.grid_shape(n_slices)
 
-        grid = [[None for _ in range(cols)] for _ in range(rows)]
-        used_indices = set()
+        # Grid aplanado en orden de filas y tablas de vecinos para ese tamaño
+        placed: List[Optional[ImageSlice]] = [None] * (rows * cols)
+        left_pos, top_pos, right_pos, bottom_pos, z_order = _build_indexers(rows, cols)
+        used_mask = np.zeros(n_slices, dtype=bool)
         
         # 1. Detectar esquina
-        print("Buscando la esquina superior izquierda...")
+        log.debug("Buscando la esquina superior izquierda...")
         start_idx = self.find_top_left_corner(n_slices)
-        grid[0][0] = self.slices[start_idx]
-        used_indices.add(start_idx)
-        print(f"-> Pieza inicial seleccionada: {self.slices[start_idx].filename}")
-        
-        # 2. Rellenar grid
-        for r in range(rows):
-            for c in range(cols):
-                if r == 0 and c == 0: continue
-                
-                best_idx = -1
-                min_cost = float('inf')
-                
-                for idx in range(n_slices):
-                    if idx in used_indices: continue
-                    
-                    cost = 0
-                    count = 0
-                    
-                    if c > 0: # Comparar con vecino izquierdo
-                        left_slice = grid[r][c-1]
-                        cost += self.calculate_cost(left_slice.id, idx, 'horizontal')
-                        count += 1
-                        
-                    if r > 0: # Comparar con vecino superior
-                        top_slice = grid[r-1][c]
-                        cost += self.calculate_cost(top_slice.id, idx, 'vertical')
-                        count += 1
-                    
-                    avg_cost = cost / count if count > 0 else float('inf')
-                    
-                    if avg_cost < min_cost:
-                        min_cost = avg_cost
-                        best_idx = idx
-                
-                # Fallback de seguridad
-                if best_idx == -1:
-                    best_idx = next(i for i in range(n_slices) if i not in used_indices)
-                
-                grid[r][c] = self.slices[best_idx]
-                used_indices.add(best_idx)
-                
+        log.debug("-> Pieza inicial seleccionada: %s", self.slices[start_idx].filename)
+        
+        # 2. Rellenar grid desde la esquina, colocando siempre primero la celda
+        # vacía con más vecinos ya colocados (la más restringida). Los empates
+        # se resuelven en orden Z para crecer en bloques compactos.
+        cost_h, cost_v = self._ensure_cost_matrices()
+        # Traspuestas contiguas: coste de cada trozo a la izquierda / encima de uno dado
+        cost_h_t = np.ascontiguousarray(cost_h.T)
+        cost_v_t = np.ascontiguousarray(cost_v.T)
+        
+        # Cada vecino colocado aporta una fila de coste según su dirección
+        neighbours = ((left_pos, cost_h), (top_pos, cost_v),
+                      (right_pos, cost_h_t), (bottom_pos, cost_v_t))
+        n_placed = np.zeros(rows * cols, dtype=np.int32)
+        heap = []
+        
+        def place(pos: int, idx: int):
+            placed[pos] = self.slices[idx]
+            used_mask[idx] = True
+            # Las celdas vecinas vacías ganan un vecino: se vuelven a encolar
+            # con la nueva prioridad (las entradas antiguas quedan obsoletas)
+            for neighbour_pos in (right_pos[pos], bottom_pos[pos], left_pos[pos], top_pos[pos]):
+                if neighbour_pos >= 0 and placed[neighbour_pos] is None:
+                    n_placed[neighbour_pos] += 1
+                    heapq.heappush(heap, (-int(n_placed[neighbour_pos]), int(z_order[neighbour_pos]), int(neighbour_pos)))
+        
+        place(0, start_idx)
+        while heap:
+            neg_count, _, pos = heapq.heappop(heap)
+            if placed[pos] is not None or -neg_count != n_placed[pos]:
+                continue
+            
+            # Coste de cada trozo en esta celda: una fila de matriz por vecino
+            # ya colocado. La media no cambia el argmin, así que basta con sumar.
+            cost = np.zeros(n_slices)
+            for table, matrix in neighbours:
+                neighbour_pos = table[pos]
+                if neighbour_pos >= 0 and placed[neighbour_pos] is not None:
+                    cost += matrix[placed[neighbour_pos].id]
+            cost[used_mask] = np.inf
+            best_idx = int(cost.argmin())
+            
+            # Fallback de seguridad
+            if used_mask[best_idx]:
+                best_idx = int(np.flatnonzero(~used_mask)[0])
+            
+            place(pos, best_idx)
+        
+        grid = [placed[r * cols:(r + 1) * cols] for r in range(rows)]
         self.save_results(grid, rows, cols)
 
     def save_results(self, grid, rows, cols):
@@ -153,8 +524,9 @@ class PuzzleSolverBase:
         specific_output_dir = os.path.join(self.output_dir, image_folder)
         os.makedirs(specific_output_dir, exist_ok=True)
         
-        h, w = self.slices[0].image.shape[:2]
-        canvas = np.zeros((h * rows, w * cols, 3), dtype=np.uint8)
+        # El grid debe estar completo para poder componer el lienzo
+        if len(grid) != rows or any(len(row) != cols or any(slc is None for slc in row) for row in grid):
+            raise ValueError(f"El grid de reconstrucción no está completo ({rows}x{cols})")
         
         # Generar nombres de archivo más simples ya que están en carpeta específica
         method_name = self.__class__.__name__.replace('Solver', '').lower()
@@ -162,22 +534,42 @@ class PuzzleSolverBase:
         map_filename = os.path.join(specific_output_dir, f"{method_name}_reconstruction_map.txt")
         img_filename = os.path.join(specific_output_dir, f"{method_name}_reconstructed.png")
         
+        # Componer el lienzo con una única permutación de ejes, sin bucle por trozo:
+        # (rows*cols, h, w, 3) -> (rows, h, cols, w, 3) -> (rows*h, cols*w, 3)
+        if self.images is not None:
+            tiles = self.images[[grid[r][c].id for r in range(rows) for c in range(cols)]]
+        else:
+            # Las imágenes no se guardaron en memoria: se releen en el orden del grid
+            paths = [grid[r][c].path for r in range(rows) for c in range(cols)]
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                images = list(executor.map(cv2.imread, paths))
+            unreadable = [p for p, img in zip(paths, images) if img is None]
+            if unreadable:
+                raise ValueError(f"No se pudieron releer los trozos: {', '.join(unreadable)}")
+            tiles = np.stack(images)
+        h, w = tiles.shape[1:3]
+        canvas = (tiles.reshape(rows, cols, h, w, 3)
+                  .transpose(0, 2, 1, 3, 4)
+                  .reshape(rows * h, cols * w, 3))
+        
+        # El mapa se compone entero en memoria y se escribe de una vez
+        lines = [
+            f"Mapa de reconstrucción para: {self.image_name or 'imagen'}",
+            f"Método utilizado: {method_name.upper()}",
+            f"Número total de trozos: {num_slices}",
+            f"Dimensiones: {rows}x{cols} trozos",
+            f"Generado por: {self.__class__.__name__}",
+            "-" * 50,
+            "POSICIÓN | ARCHIVO ORIGINAL",
+            "-" * 30
+        ]
+        lines.extend(f"({r},{c}) -> {grid[r][c].filename}" for r in range(rows) for c in range(cols))
+        
         with open(map_filename, 'w') as f:
-            f.write(f"Mapa de reconstrucción para: {self.image_name or 'imagen'}\n")
-            f.write(f"Método utilizado: {method_name.upper()}\n")
-            f.write(f"Número total de trozos: {num_slices}\n")
-            f.write(f"Dimensiones: {rows}x{cols} trozos\n")
-            f.write(f"Generado por: {self.__class__.__name__}\n")
-            f.write("-" * 50 + "\n")
-            f.write("POSICIÓN | ARCHIVO ORIGINAL\n")
-            f.write("-" * 30 + "\n")
-            
-            for r in range(rows):
-                for c in range(cols):
-                    slc = grid[r][c]
-                    f.write(f"({r},{c}) -> {slc.filename}\n")
-                    canvas[r*h:(r+1)*h, c*w:(c+1)*w] = slc.image
+            f.write("\n".join(lines) + "\n")
         
+        # Sin parámetros: la configuración PNG por defecto de OpenCV (nivel rápido,
+        # filtro SUB y estrategia RLE) codifica antes que fijar el nivel a mano
         cv2.imwrite(img_filename, canvas)
-        print(f"✓ Imagen guardada: {img_filename}")
-        print(f"✓ Mapa guardado: {map_filename}")
+        log.info("✓ Imagen guardada: %s", img_filename)
+        log.info("✓ Mapa guardado: %s", map_filename)
@@ -1,15 +1,23 @@
-import math
+import logging
 import os
 import sys
+from typing import Optional
 
 # Asegurar que se puede importar puzzle_base desde el mismo directorio
 sys.path.insert(0, os.path.dirname(__file__))
 
 from puzzle_base import PuzzleSolverBase
 
+log = logging.getLogger(__name__)
+
 class RandomSolver(PuzzleSolverBase):
-    def __init__(self, sliced_dir: str, output_dir: str, image_name: str = ""):
-        super().__init__(sliced_dir, output_dir, image_name)
+    # No compara bordes: los trozos solo se decodifican para componer el lienzo
+    needs_features = False
+    
+    def __init__(self, sliced_dir: str, output_dir: str, image_name: str = "", keep_images: Optional[bool] = None,
+                 rows: Optional[int] = None, cols: Optional[int] = None,
+                 shortlist_k: Optional[int] = None):
+        super().__init__(sliced_dir, output_dir, image_name, keep_images, rows, cols, shortlist_k)
     
     def solve(self):
         """
@@ -18,27 +26,29 @@ class RandomSolver(PuzzleSolverBase):
         Como el input son trozos desordenados, el output mostrará ese desorden.
         """
         n_slices = len(self.slices)
-        side = int(math.sqrt(n_slices))
+        rows, cols = self.grid_shape(n_slices)
         
         grid = []
         iterator = iter(self.slices)
         
-        print("Generando vista aleatoria (orden de lectura)...")
+        log.debug("Generando vista aleatoria (orden de lectura)...")
         
-        for r in range(side):
+        for r in range(rows):
             row = []
-            for c in range(side):
+            for c in range(cols):
                 try:
                     row.append(next(iterator))
                 except StopIteration:
                     break
             grid.append(row)
             
-        self.save_results(grid, side, side)
+        self.save_results(grid, rows, cols)
 
 if __name__ == "__main__":
     import sys
     
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+    
     # Usar argumento de línea de comandos o pedir al usuario
     if len(sys.argv) > 1:
         NOMBRE_BASE = sys.argv[1]
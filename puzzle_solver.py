@@ -6,8 +6,8 @@ Usa diferentes métodos para reconstruir imágenes divididas en trozos.
 
 import os
 import sys
-import glob
 import argparse
+import logging
 
 # Agregar la carpeta puzzle_reconstructor al path de Python
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'puzzle_reconstructor'))
@@ -16,12 +16,25 @@ from gradient_reconstructor import GradientSolver
 from color_reconstructor import ColorSolver
 from random_reconstructor import RandomSolver
 
+log = logging.getLogger(__name__)
+
+
+def _positive_int(value):
+    """Tipo de argparse para enteros mayores que cero."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' no es un entero")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"debe ser un entero positivo: {number}")
+    return number
+
 
 def find_available_images(sliced_dir="sliced_images"):
     """
     Encuentra todas las imágenes disponibles en la carpeta de trozos.
     Busca en subcarpetas con formato nombre_Nslices.
-    Retorna una lista de tuplas (nombre_base, num_slices, ruta_carpeta)
+    Retorna una lista de tuplas (nombre_base, num_slices, ruta_carpeta, num_archivos)
     """
     if not os.path.exists(sliced_dir):
         return []
@@ -39,23 +52,17 @@ def find_available_images(sliced_dir="sliced_images"):
                     name_base = parts[0]
                     num_slices = int(parts[1].replace("slices", ""))
                     
-                    # Verificar que la carpeta contenga archivos slice
-                    slice_files = glob.glob(os.path.join(item_path, "*_slice_*.png"))
-                    if slice_files:
-                        available_configs.append((name_base, num_slices, item_path))
+                    # Contar los archivos slice en una sola pasada por la carpeta
+                    with os.scandir(item_path) as entries:
+                        count = sum(1 for e in entries if '_slice_' in e.name and e.name.endswith('.png'))
+                    if count:
+                        available_configs.append((name_base, num_slices, item_path, count))
             except (ValueError, IndexError):
                 continue
     
     return sorted(available_configs, key=lambda x: (x[0], x[1]))
 
 
-def get_slice_count(base_name, slices_path):
-    """Cuenta cuántos trozos hay para una configuración específica."""
-    pattern = os.path.join(slices_path, f"{base_name}_slice_*.png")
-    files = glob.glob(pattern)
-    return len(files)
-
-
 def show_available_images(sliced_dir="sliced_images"):
     """Muestra las imágenes disponibles para reconstruir."""
     configs = find_available_images(sliced_dir)
@@ -67,8 +74,7 @@ def show_available_images(sliced_dir="sliced_images"):
     print(f"\n📁 Configuraciones disponibles en '{sliced_dir}':")
     print("-" * 50)
     
-    for i, (name_base, num_slices, slices_path) in enumerate(configs, 1):
-        actual_count = get_slice_count(name_base, slices_path)
+    for i, (name_base, num_slices, slices_path, actual_count) in enumerate(configs, 1):
         print(f"{i:2d}. {name_base} - {num_slices} trozos ({actual_count} archivos)")
     
     return configs
@@ -101,7 +107,7 @@ def get_user_choice():
             
             idx = int(choice) - 1
             if 0 <= idx < len(available_configs):
-                selected_name, selected_slices, selected_path = available_configs[idx]
+                selected_name, selected_slices, selected_path, actual_slice_count = available_configs[idx]
                 break
             else:
                 print(f"❌ Por favor, introduce un número entre 1 y {len(available_configs)}")
@@ -109,7 +115,6 @@ def get_user_choice():
             print("❌ Por favor, introduce un número válido")
     
     # Mostrar información de la configuración seleccionada
-    actual_slice_count = get_slice_count(selected_name, selected_path)
     print(f"\n✅ Configuración seleccionada: {selected_name}")
     print(f"📊 Número de trozos: {selected_slices} ({actual_slice_count} archivos)")
     print(f"📂 Carpeta: {selected_path}")
@@ -139,29 +144,36 @@ def get_user_choice():
     return selected_name, selected_method, selected_path, OUTPUT_DIR
 
 
-def run_solver(image_name, method, slices_path, output_dir):
-    """Ejecuta el solucionador especificado."""
+def run_solver(image_name, method, slices_path, output_dir, rows=None, cols=None, shortlist_k=None):
+    """
+    Ejecuta el solucionador especificado.
+    rows/cols fijan la forma del grid; si se omiten, el solver la deduce.
+    shortlist_k limita el coste exacto a los k mejores candidatos por trozo.
+    """
     
-    print(f"\n🚀 Iniciando reconstrucción con método: {method.upper()}")
-    print("-" * 50)
+    log.info("\n🚀 Iniciando reconstrucción con método: %s", method.upper())
+    log.info("-" * 50)
     
     try:
         if method == 'gradient':
-            solver = GradientSolver(slices_path, output_dir, image_name)
+            solver = GradientSolver(slices_path, output_dir, image_name, rows=rows, cols=cols,
+                                    shortlist_k=shortlist_k)
         elif method == 'color':
-            solver = ColorSolver(slices_path, output_dir, image_name)
+            solver = ColorSolver(slices_path, output_dir, image_name, rows=rows, cols=cols,
+                                 shortlist_k=shortlist_k)
         elif method == 'random':
-            solver = RandomSolver(slices_path, output_dir, image_name)
+            solver = RandomSolver(slices_path, output_dir, image_name, rows=rows, cols=cols,
+                                  shortlist_k=shortlist_k)
         else:
             raise ValueError(f"Método desconocido: {method}")
         
         solver.load_slices(image_name)
         solver.solve()
         
-        print(f"✅ Reconstrucción completada con método: {method.upper()}")
+        log.info("✅ Reconstrucción completada con método: %s", method.upper())
         
     except Exception as e:
-        print(f"❌ Error durante la reconstrucción: {e}")
+        log.error("❌ Error durante la reconstrucción: %s", e)
         return False
     
     return True
@@ -191,6 +203,14 @@ Ejemplos de uso:
                        help='Directorio con los trozos (default: sliced_images)')
     parser.add_argument('--output-dir', default='output_images',
                        help='Directorio de salida (default: output_images)')
+    parser.add_argument('--rows', type=_positive_int,
+                       help='Filas del puzzle (default: se deducen de la geometría)')
+    parser.add_argument('--cols', type=_positive_int,
+                       help='Columnas del puzzle (default: se deducen de la geometría)')
+    parser.add_argument('--shortlist-k', type=_positive_int,
+                       help='Preseleccionar con firmas de borde los k mejores candidatos por '
+                            'trozo y calcular el coste exacto solo para ellos. Más rápido en '
+                            'puzzles grandes; solo lo usa el método color (default: coste exacto)')
     
     args = parser.parse_args()
     
@@ -201,13 +221,17 @@ Ejemplos de uso:
         sliced_dir = args.sliced_dir
         output_dir = args.output_dir
         
-        # Verificar que la imagen existe
-        available_images = find_available_images(sliced_dir)
-        if image_name not in available_images:
+        # Verificar que la imagen existe (índice por nombre base; si hay varias
+        # configuraciones de la misma imagen, se usa la de más trozos)
+        by_name = {config[0]: config for config in find_available_images(sliced_dir)}
+        if image_name not in by_name:
             print(f"❌ Error: No se encontró la imagen '{image_name}' en '{sliced_dir}'")
-            print(f"📋 Imágenes disponibles: {', '.join(available_images)}")
+            print(f"📋 Imágenes disponibles: {', '.join(by_name)}")
             return
         
+        # Los trozos están en la subcarpeta de esa configuración
+        sliced_dir = by_name[image_name][2]
+        
     # Modo interactivo
     else:
         image_name, method, sliced_dir, output_dir = get_user_choice()
@@ -225,7 +249,8 @@ Ejemplos de uso:
         
         results = []
         for single_method in methods_to_run:
-            success = run_solver(image_name, single_method, sliced_dir, output_dir)
+            success = run_solver(image_name, single_method, sliced_dir, output_dir,
+                                 args.rows, args.cols, args.shortlist_k)
             results.append((single_method, success))
         
         # Resumen final
@@ -247,13 +272,15 @@ Ejemplos de uso:
             print("🎨 Compara los diferentes métodos para ver cuál funciona mejor!")
     
     else:
-        success = run_solver(image_name, method, sliced_dir, output_dir)
+        success = run_solver(image_name, method, sliced_dir, output_dir,
+                             args.rows, args.cols, args.shortlist_k)
         
         if success:
             print(f"\n📁 Resultado guardado en: {output_dir}/")
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
     try:
         main()
     except KeyboardInterrupt:
@@ -3,10 +3,23 @@ import math
 import cv2
 import numpy as np
 import argparse
-import random
+import re
+import json
+import functools
+import hashlib
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 
+# A partir de este tamaño (bytes) la imagen reconstruida se compone en un
+# archivo mapeado en memoria en lugar de en RAM
+RECONSTRUCT_MEMMAP_BYTES = 2 << 30
 
-def slice_image(image_path, num_slices, output_dir="sliced_images"):
+# Cabecera del archivo de orden: dimensiones de la imagen, división y tamaño de trozo
+_HEADER_RE = re.compile(r"Imagen original: (\d+)x(\d+)|División: (\d+)x(\d+)|Tamaño de cada trozo: (\d+)x(\d+)")
+
+
+def slice_image(image_path, num_slices, output_dir="sliced_images", format="png", container="png",
+                drop_cache=False):
     """
     Divide una imagen en num_slices partes cuadradas y genera un archivo de texto
     con el orden correcto para la recomposición.
@@ -15,9 +28,33 @@ def slice_image(image_path, num_slices, output_dir="sliced_images"):
         image_path (str): Ruta a la imagen a dividir
         num_slices (int): Número de partes (debe tener raíz cuadrada exacta)
         output_dir (str): Carpeta donde guardar las partes
+        format (str): 'png' (sin pérdida, el que leen los solvers), 'jpg'
+            (más rápido de codificar, con libjpeg-turbo si está instalado) o
+            'bin' (bytes BGR sin cabecera; reconstruct_image los copia sin decodificar)
+        container (str): 'png' guarda un archivo por trozo (lo que leen los
+            solvers); 'npz' o 'tif' guardan todos los trozos en un único
+            archivo <nombre>_tiles.npz / <nombre>_tiles.tif, y 'pack' los
+            concatena ya codificados en format en <nombre>_tiles.pack con
+            un índice de posiciones <nombre>_tiles_index.json. Los
+            contenedores solo los usa reconstruct_image. 'npz' y 'tif'
+            guardan los píxeles sin codificar, así que solo admiten
+            format='png'
+        drop_cache (bool): descarta de la caché de páginas del sistema cada
+            trozo recién escrito. Útil si los trozos se envían a otra máquina;
+            si se van a leer aquí mismo (main.py) es mejor dejarlo en False.
+            Requiere posix_fadvise (no existe en Windows ni macOS)
     """
+    if format not in ('png', 'jpg', 'bin'):
+        raise ValueError(f"Formato de trozo no soportado: {format}")
+    if container not in ('png', 'npz', 'tif', 'pack'):
+        raise ValueError(f"Contenedor no soportado: {container}")
+    if container in ('npz', 'tif') and format != 'png':
+        raise ValueError(f"El contenedor {container} no usa el formato de trozo: {format} solo vale con png o pack")
+    if drop_cache and not hasattr(os, 'posix_fadvise'):
+        print("Advertencia: este sistema no tiene posix_fadvise; drop_cache no tendrá efecto")
+    
     # Verificar que num_slices tiene raíz cuadrada exacta
-    sqrt_slices = int(math.sqrt(num_slices))
+    sqrt_slices = math.isqrt(num_slices)
     if sqrt_slices * sqrt_slices != num_slices:
         raise ValueError(f"El número {num_slices} no tiene raíz cuadrada exacta")
     
@@ -28,7 +65,7 @@ def slice_image(image_path, num_slices, output_dir="sliced_images"):
     
     # Abrir la imagen
     try:
-        img = cv2.imread(image_path)
+        img = _load_image(image_path)
         if img is None:
             raise ValueError(f"No se pudo cargar la imagen: {image_path}")
     except Exception as e:
@@ -41,113 +78,434 @@ def slice_image(image_path, num_slices, output_dir="sliced_images"):
     slice_width = img_width // sqrt_slices
     slice_height = img_height // sqrt_slices
     
-    # Obtener nombre base del archivo sin extensión
-    base_name = os.path.splitext(os.path.basename(image_path))[0]
+    # Vista 5-D (fila, col, alto, ancho, canales) de los trozos, sin copiar:
+    # se recorta el sobrante que no divide exactamente y se separan los ejes
+    tiles = (img[:sqrt_slices * slice_height, :sqrt_slices * slice_width]
+             .reshape(sqrt_slices, slice_height, sqrt_slices, slice_width, *img.shape[2:])
+             .swapaxes(1, 2))
     
     print(f"Dividiendo imagen {image_path} en {num_slices} partes ({sqrt_slices}x{sqrt_slices})")
     print(f"Guardando en carpeta: {specific_output_dir}")
     print(f"Dimensiones originales: {img_width}x{img_height}")
     print(f"Dimensiones de cada trozo: {slice_width}x{slice_height}")
     
-    # Lista para almacenar el orden de los trozos
-    slice_order = []
-    
-    # Dividir la imagen
-    slice_index = 0
-    slice_positions = []
-    
-    # Crear lista de posiciones y mezclarla aleatoriamente
-    for row in range(sqrt_slices):
-        for col in range(sqrt_slices):
-            slice_positions.append((row, col, slice_index))
-            slice_index += 1
-    
-    # Mezclar las posiciones aleatoriamente para guardar en orden aleatorio
-    random.shuffle(slice_positions)
-    
-    # Procesar cada trozo en orden aleatorio
-    for idx, (row, col, original_position) in enumerate(slice_positions):
-        # Calcular coordenadas del trozo
-        left = col * slice_width
-        top = row * slice_height
-        right = left + slice_width
-        bottom = top + slice_height
-        
-        # Extraer el trozo usando OpenCV (y:y+h, x:x+w)
-        slice_img = img[top:bottom, left:right]
-        
-        # Generar nombre del archivo del trozo (usando índice aleatorio)
-        slice_filename = f"{base_name}_slice_{idx:03d}.png"
-        slice_path = os.path.join(specific_output_dir, slice_filename)
-        
-        # Guardar el trozo
-        cv2.imwrite(slice_path, slice_img)
+    # Orden aleatorio de guardado: el archivo idx es el trozo de la posición
+    # original perm[idx], cuya fila y columna salen de la división entera
+    perm = np.random.permutation(num_slices)
+    rows, cols = np.divmod(perm, sqrt_slices)
+    
+    # Prefijos de nombre y ruta de los trozos, calculados una sola vez
+    name_prefix = f"{base_name}_slice_"
+    path_prefix = os.path.join(specific_output_dir, name_prefix)
+    
+    # Contenedores de una división anterior en esta carpeta que esta no
+    # sobrescribe: se borran para que no queden trozos de otro orden aleatorio
+    container_name = f"{base_name}_tiles.{container}" if container != 'png' else None
+    for stale in _container_files(base_name):
+        if stale != container_name:
+            _remove_container(os.path.join(specific_output_dir, stale))
+    # Igual con los trozos sueltos de otro formato o de una división en
+    # contenedor: los solvers leerían PNG que ya no encajan con el orden nuevo
+    written = ({f"{name_prefix}{idx:03d}.{format}" for idx in range(num_slices)}
+               if container == 'png' else set())
+    _remove_stale_slices(specific_output_dir, name_prefix, written)
+    
+    if container == 'png':
+        saved = list(enumerate(zip(rows.tolist(), cols.tolist(), perm.tolist())))
+        # Procesar cada trozo en orden aleatorio. La compresión PNG de OpenCV
+        # libera el GIL, así que los trozos se codifican y guardan en paralelo.
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            # Los trozos idénticos (fondos de color liso) se codifican una sola
+            # vez: el resto se enlazan al primero con el mismo contenido
+            digests = executor.map(_tile_digest, [tiles[row, col] for _, (row, col, _) in saved])
+            first_with = {}
+            duplicates = []
+            jobs = []
+            for (idx, (row, col, original_position)), digest in zip(saved, digests):
+                if digest in first_with:
+                    duplicates.append((idx, first_with[digest]))
+                    jobs.append(None)
+                    continue
+                first_with[digest] = idx
+                jobs.append(executor.submit(_encode_and_write, idx, row, col, original_position, tiles[row, col],
+                                            slice_width, slice_height, name_prefix, path_prefix, format, drop_cache))
+            slice_order = [job.result() if job is not None else None for job in jobs]
         
-        # Agregar información del orden para recomposición
-        slice_order.append({
-            'filename': slice_filename,
-            'row': row,
-            'col': col,
-            'original_position': original_position,
-            'saved_as_index': idx,
-            'coordinates': {'left': left, 'top': top, 'right': right, 'bottom': bottom}
-        })
+        for idx, source_idx in duplicates:
+            row, col, original_position = saved[idx][1]
+            suffix = f"{idx:03d}.{format}"
+            _link_slice(f"{path_prefix}{source_idx:03d}.{format}", path_prefix + suffix)
+            slice_order[idx] = _slice_info(idx, row, col, original_position, slice_width, slice_height,
+                                           name_prefix + suffix)
+    else:
+        # Un único archivo con todos los trozos (N, alto, ancho, canales) en el
+        # orden aleatorio de guardado: un solo inodo y una escritura secuencial
+        container_path = os.path.join(specific_output_dir, container_name)
+        if container == 'pack':
+            _write_pack(container_path, [tiles[row, col] for row, col in zip(rows.tolist(), cols.tolist())],
+                        [f"{name_prefix}{idx:03d}.{format}" for idx in range(num_slices)], format)
+        else:
+            _write_container(container_path, tiles[rows, cols], perm)
+        slice_order = [_slice_info(idx, row, col, original_position, slice_width, slice_height,
+                                   f"{name_prefix}{idx:03d}")
+                       for idx, (row, col, original_position)
+                       in enumerate(zip(rows.tolist(), cols.tolist(), perm.tolist()))]
+    
+    # Ambas claves son enteros densos 0..N-1: basta con colocar cada trozo en
+    # su casilla (orden por posición original y por índice de archivo guardado)
+    sorted_slices = [None] * num_slices
+    sorted_by_file = [None] * num_slices
+    for slice_info in slice_order:
+        sorted_slices[slice_info['original_position']] = slice_info
+        sorted_by_file[slice_info['saved_as_index']] = slice_info
     
     # Generar archivo de texto con el orden correcto
     order_filename = f"{base_name}_order.txt"
     order_path = os.path.join(specific_output_dir, order_filename)
     
+    # El archivo se compone entero en memoria y se escribe de una vez
+    header_lines = [
+        f"Información de recomposición para: {os.path.basename(image_path)}\n",
+        f"Imagen original: {img_width}x{img_height}\n",
+        f"División: {sqrt_slices}x{sqrt_slices} ({num_slices} trozos)\n",
+        f"Tamaño de cada trozo: {slice_width}x{slice_height}\n",
+    ]
+    if container_name:
+        header_lines.append(f"Contenedor: {container_name}\n")
+    header_lines += [
+        "NOTA: Los trozos fueron guardados en ORDEN ALEATORIO\n",
+        "-" * 50 + "\n\n",
+        # Información detallada de cada trozo (ordenado por posición original)
+        "ORDEN CORRECTO PARA RECOMPOSICIÓN:\n",
+        "Pos.Orig | Archivo Guardado    | Fila | Col | Índice Guardado\n",
+        "-" * 65 + "\n",
+    ]
+    detail_lines = [
+        f"{s['original_position']:8d} | {s['filename']:18s} | "
+        f"{s['row']:4d} | {s['col']:3d} | {s['saved_as_index']:14d}\n"
+        for s in sorted_slices
+    ]
+    map_lines = ["\n" + "-" * 50 + "\n", "MAPEO DE ARCHIVOS (Archivo -> Posición Original):\n"]
+    map_lines += [
+        f"{s['filename']} -> Posición original {s['original_position']} "
+        f"(Fila {s['row']}, Col {s['col']})\n"
+        for s in sorted_by_file
+    ]
+    coord_lines = ["\n" + "-" * 50 + "\n", "COORDENADAS ORIGINALES:\n"]
+    coord_lines += [
+        f"{s['filename']}: ({s['coordinates']['left']}, {s['coordinates']['top']}) -> "
+        f"({s['coordinates']['right']}, {s['coordinates']['bottom']})\n"
+        for s in sorted_slices
+    ]
+    
     with open(order_path, 'w', encoding='utf-8') as f:
-        f.write(f"Información de recomposición para: {os.path.basename(image_path)}\n")
-        f.write(f"Imagen original: {img_width}x{img_height}\n")
-        f.write(f"División: {sqrt_slices}x{sqrt_slices} ({num_slices} trozos)\n")
-        f.write(f"Tamaño de cada trozo: {slice_width}x{slice_height}\n")
-        f.write("NOTA: Los trozos fueron guardados en ORDEN ALEATORIO\n")
-        f.write("-" * 50 + "\n\n")
-        
-        # Escribir información detallada de cada trozo (ordenado por posición original)
-        f.write("ORDEN CORRECTO PARA RECOMPOSICIÓN:\n")
-        f.write("Pos.Orig | Archivo Guardado    | Fila | Col | Índice Guardado\n")
-        f.write("-" * 65 + "\n")
-        
-        # Ordenar por posición original para mostrar el orden correcto
-        sorted_slices = sorted(slice_order, key=lambda x: x['original_position'])
-        
-        for slice_info in sorted_slices:
-            f.write(f"{slice_info['original_position']:8d} | {slice_info['filename']:18s} | "
-                   f"{slice_info['row']:4d} | {slice_info['col']:3d} | "
-                   f"{slice_info['saved_as_index']:14d}\n")
-        
-        f.write("\n" + "-" * 50 + "\n")
-        f.write("MAPEO DE ARCHIVOS (Archivo -> Posición Original):\n")
-        # Ordenar por índice de archivo guardado
-        sorted_by_file = sorted(slice_order, key=lambda x: x['saved_as_index'])
-        for slice_info in sorted_by_file:
-            f.write(f"{slice_info['filename']} -> Posición original {slice_info['original_position']} "
-                   f"(Fila {slice_info['row']}, Col {slice_info['col']})\n")
-        
-        f.write("\n" + "-" * 50 + "\n")
-        f.write("COORDENADAS ORIGINALES:\n")
-        for slice_info in sorted_slices:
-            coords = slice_info['coordinates']
-            f.write(f"{slice_info['filename']}: "
-                   f"({coords['left']}, {coords['top']}) -> "
-                   f"({coords['right']}, {coords['bottom']})\n")
+        f.write("".join(header_lines + detail_lines + map_lines + coord_lines))
     
     print(f"✓ Imagen dividida exitosamente en {num_slices} partes")
     print(f"✓ Trozos guardados en: {specific_output_dir}/")
+    # Copia en JSON para que reconstruct_image no tenga que interpretar el texto
+    json_path = os.path.join(specific_output_dir, f"{base_name}_order.json")
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'image': os.path.basename(image_path),
+            'width': img_width,
+            'height': img_height,
+            'sqrt': sqrt_slices,
+            'slice_width': slice_width,
+            'slice_height': slice_height,
+            'container': container_name,
+            'tiles': sorted_by_file
+        }, f)
+    
     print(f"✓ Archivo de orden creado: {order_path}")
     
     return slice_order
 
 
-def reconstruct_image(order_file_path, output_path="reconstructed_image.png"):
+def _load_image(image_path):
     """
-    Recompone una imagen a partir del archivo de orden.
+    Carga la imagen a dividir como array BGR. Los TIFF sin comprimir se mapean
+    con tifffile.memmap (si está instalado) en lugar de decodificarse enteros:
+    cada trozo se lee del disco solo cuando se guarda. El resto, con cv2.imread.
+    """
+    if image_path.lower().endswith(('.tif', '.tiff')):
+        try:
+            import tifffile
+            img = tifffile.memmap(image_path, mode='r')
+        except (ImportError, ValueError, OSError):
+            img = None
+        if img is not None and img.ndim == 3 and img.shape[2] == 3 and img.dtype == np.uint8:
+            return img[..., ::-1]  # RGB -> BGR como vista, sin copiar
+    return cv2.imread(image_path)
+
+
+def _encode_and_write(idx, row, col, original_position, slice_img, slice_width, slice_height,
+                      name_prefix, path_prefix, format="png", drop_cache=False):
+    """
+    Guarda el trozo (row, col) con el índice aleatorio idx y devuelve su
+    información para el archivo de orden. name_prefix es "<nombre>_slice_" y
+    path_prefix esa misma cadena ya unida a la carpeta de salida.
+    """
+    # Generar nombre del archivo del trozo (usando índice aleatorio)
+    suffix = f"{idx:03d}.{format}"
+    slice_filename = name_prefix + suffix
+    slice_path = path_prefix + suffix
     
-    Args:
-        order_file_path (str): Ruta al archivo de orden .txt
-        output_path (str): Ruta donde guardar la imagen reconstruida
+    # Guardar el trozo
+    _write_slice(slice_path, slice_img, drop_cache)
+    
+    return _slice_info(idx, row, col, original_position, slice_width, slice_height, slice_filename)
+
+
+def _slice_info(idx, row, col, original_position, slice_width, slice_height, slice_filename):
+    """Información del trozo (row, col) guardado con el índice idx para el archivo de orden."""
+    # Coordenadas del trozo en la imagen original
+    left = col * slice_width
+    top = row * slice_height
+    right = left + slice_width
+    bottom = top + slice_height
+    
+    # Información del orden para recomposición
+    return {
+        'filename': slice_filename,
+        'row': row,
+        'col': col,
+        'original_position': original_position,
+        'saved_as_index': idx,
+        'coordinates': {'left': left, 'top': top, 'right': right, 'bottom': bottom}
+    }
+
+
+def _container_files(base_name):
+    """Nombres de los contenedores de trozos que slice_image puede generar para base_name."""
+    return [f"{base_name}_tiles.npz", f"{base_name}_tiles.tif", f"{base_name}_tiles.pack"]
+
+
+def _remove_stale_slices(directory, name_prefix, written):
+    """Borra los <nombre>_slice_*.png/.jpg/.bin de directory que no estén en written."""
+    with os.scandir(directory) as entries:
+        stale = [entry.path for entry in entries
+                 if entry.name.startswith(name_prefix) and entry.name not in written
+                 and entry.name.endswith(('.png', '.jpg', '.bin'))]
+    for path in stale:
+        os.remove(path)
+
+
+def _remove_container(container_path):
+    """Borra un contenedor de trozos (y el índice de un .pack), si existen."""
+    paths = [container_path]
+    if container_path.endswith('.pack'):
+        paths.append(_pack_index_path(container_path))
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _pack_index_path(pack_path):
+    """Ruta del índice de posiciones de un .pack: <nombre>_tiles_index.json."""
+    return os.path.splitext(pack_path)[0] + "_index.json"
+
+
+def _write_container(container_path, tiles, perm):
+    """
+    Guarda todos los trozos (N, alto, ancho, 3) en un único archivo. En .npz
+    van junto con la permutación de guardado; en .tif cada trozo es una
+    página (RGB, zlib) y hace falta tifffile.
+    """
+    if container_path.endswith('.npz'):
+        np.savez_compressed(container_path, tiles=tiles, order=perm)
+        return
+    try:
+        import tifffile
+    except ImportError:
+        raise ValueError("El contenedor 'tif' requiere tifffile (pip install tifffile)")
+    tifffile.imwrite(container_path, tiles[..., ::-1], photometric='rgb', compression='zlib')
+
+
+def _write_pack(pack_path, saved_tiles, tile_names, format):
+    """
+    Codifica los trozos en paralelo y los escribe uno tras otro en pack_path.
+    El índice <nombre>_index.json guarda el formato, el tamaño de los trozos
+    y el (desplazamiento, longitud) de cada uno en orden de guardado.
+    """
+    offsets = []
+    position = 0
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor, open(pack_path, 'wb') as f:
+        for data in executor.map(_encode_slice, tile_names, saved_tiles):
+            f.write(data)
+            offsets.append((position, len(data)))
+            position += len(data)
+    
+    with open(_pack_index_path(pack_path), 'w', encoding='utf-8') as f:
+        json.dump({'format': format, 'shape': list(saved_tiles[0].shape[:2]), 'offsets': offsets}, f)
+
+
+def _read_pack(pack_path):
+    """Decodifica en paralelo los trozos de un .pack, leyéndolos de un np.memmap del archivo."""
+    with open(_pack_index_path(pack_path), 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    shape = index['shape']
+    packed = np.memmap(pack_path, dtype=np.uint8, mode='r')
+    saved_tiles = np.empty((len(index['offsets']), shape[0], shape[1], 3), dtype=np.uint8)
+    
+    def decode(i):
+        offset, length = index['offsets'][i]
+        slice_img = _decode_slice(packed[offset:offset + length], index['format'], shape)
+        if slice_img is None or slice_img.shape[:2] != tuple(shape):
+            raise ValueError(f"No se pudo decodificar el trozo {i} de {pack_path}")
+        saved_tiles[i] = slice_img
+    
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        list(executor.map(decode, range(len(saved_tiles))))
+    return saved_tiles
+
+
+def _read_container(container_path):
+    """Lee los trozos (N, alto, ancho, 3) de un contenedor .npz, .tif o .pack en orden de guardado."""
+    if container_path.endswith('.pack'):
+        return _read_pack(container_path)
+    if container_path.endswith('.npz'):
+        with np.load(container_path) as data:
+            return data['tiles']
+    try:
+        import tifffile
+    except ImportError:
+        raise ValueError("El contenedor 'tif' requiere tifffile (pip install tifffile)")
+    return tifffile.imread(container_path)[..., ::-1]
+
+
+def _tile_digest(slice_img):
+    """Huella del contenido de un trozo (xxh3 si xxhash está instalado, si no blake2b)."""
+    data = np.ascontiguousarray(slice_img)
+    try:
+        import xxhash
+        return xxhash.xxh3_128_digest(data)
+    except ImportError:
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _link_slice(source_path, slice_path):
+    """Crea slice_path como enlace duro a source_path, o como copia si el sistema de archivos no lo permite."""
+    if os.path.lexists(slice_path):
+        os.remove(slice_path)  # Restos de una división anterior
+    try:
+        os.link(source_path, slice_path)
+    except OSError:
+        shutil.copyfile(source_path, slice_path)
+
+
+@functools.lru_cache(maxsize=1)
+def _turbojpeg():
+    """Codificador de libjpeg-turbo (PyTurboJPEG), o None si no está disponible."""
+    try:
+        from turbojpeg import TurboJPEG
+        return TurboJPEG()
+    except (ImportError, OSError, RuntimeError):
+        return None
+
+
+def _write_slice(slice_path, slice_img, drop_cache=False):
+    """
+    Guarda un trozo. Se codifica en memoria y se escribe con una sola llamada.
+    """
+    data = _encode_slice(slice_path, slice_img)
+    
+    # Siempre un inodo nuevo: el archivo anterior puede ser un enlace duro
+    # compartido con otro trozo (deduplicación de una división anterior)
+    try:
+        os.remove(slice_path)
+    except FileNotFoundError:
+        pass
+    # O_BINARY (solo existe en Windows) evita que os.write convierta \n en \r\n
+    fd = os.open(slice_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        # os.write puede escribir menos bytes de los pedidos: se repite hasta el final
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        if drop_cache and hasattr(os, 'posix_fadvise'):
+            # Las páginas sucias no se pueden descartar: primero se vuelcan a disco
+            os.fdatasync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def _encode_slice(slice_path, slice_img):
+    """
+    Codifica un trozo según la extensión de slice_path y devuelve los bytes.
+    Los PNG usan la configuración por defecto de OpenCV, los JPEG se
+    codifican con libjpeg-turbo si está instalado y los .bin son los bytes
+    del trozo tal cual (alto, ancho, 3).
+    """
+    if slice_path.endswith('.bin'):
+        return np.ascontiguousarray(slice_img).tobytes()
+    if slice_path.endswith('.jpg'):
+        encoder = _turbojpeg()
+        if encoder is not None:
+            return encoder.encode(np.ascontiguousarray(slice_img), quality=95)
+        return cv2.imencode('.jpg', slice_img, [cv2.IMWRITE_JPEG_QUALITY, 95])[1].tobytes()
+    ok, buf = cv2.imencode('.png', slice_img, _imwrite_params(slice_path))
+    if not ok:
+        raise ValueError(f"No se pudo codificar el trozo: {slice_path}")
+    return buf.tobytes()
+
+
+def _decode_slice(data, format, shape):
+    """Inversa de _encode_slice para un trozo en memoria (bytes o vista de un memmap)."""
+    if format == 'bin':
+        return np.frombuffer(data, dtype=np.uint8).reshape(shape[0], shape[1], 3)
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def _imwrite_params(path):
+    """
+    Parámetros de cv2.imwrite según la extensión del archivo de salida.
+    Los PNG van sin parámetros: la configuración por defecto de OpenCV (nivel
+    rápido, filtro SUB y estrategia RLE) es más rápida que fijar el nivel o la
+    estrategia a mano. JPEG con calidad 92 para resultados que solo se van a
+    visualizar.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.jpg', '.jpeg'):
+        return [cv2.IMWRITE_JPEG_QUALITY, 92]
+    return []
+
+
+def _read_slice(slice_path, shape=None):
+    """
+    Lee un trozo del disco. Devuelve None si no existe o no se puede leer.
+    Los .bin no se decodifican: se mapean como (alto, ancho, 3) con la forma
+    shape del archivo de orden y se copian al usarlos.
+    """
+    if not os.path.exists(slice_path):
+        return None
+    if slice_path.endswith('.bin'):
+        if shape is None or os.path.getsize(slice_path) != shape[0] * shape[1] * 3:
+            return None
+        return np.memmap(slice_path, dtype=np.uint8, mode='r', shape=(shape[0], shape[1], 3))
+    return cv2.imread(slice_path)
+
+
+def _read_order_json(json_path):
+    """
+    Lee la copia JSON del archivo de orden.
+    Devuelve (filas, columnas, ancho_trozo, alto_trozo,
+    [(pos_original, archivo, índice_guardado)], contenedor o None).
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        order = json.load(f)
+    table = [(tile['original_position'], tile['filename'], tile['saved_as_index'])
+             for tile in order['tiles']]
+    return (order['sqrt'], order['sqrt'], order['slice_width'], order['slice_height'], table,
+            order.get('container'))
+
+
+def _read_order_txt(order_file_path):
+    """
+    Interpreta el archivo de orden en texto generado por slice_image.
+    Devuelve (filas, columnas, ancho_trozo, alto_trozo,
+    [(pos_original, archivo, índice_guardado)], contenedor o None).
     """
     # Leer el archivo de orden
     with open(order_file_path, 'r', encoding='utf-8') as f:
@@ -158,64 +516,180 @@ def reconstruct_image(order_file_path, output_path="reconstructed_image.png"):
     division = None
     slice_size = None
     
+    # Una sola pasada con la expresión compilada; la cabecera está al principio
     for line in lines:
-        if line.startswith("Imagen original:"):
-            dims = line.split(":")[1].strip().split("x")
-            img_dimensions = (int(dims[0]), int(dims[1]))
-        elif line.startswith("División:"):
-            div_info = line.split(":")[1].strip().split("x")
-            division = (int(div_info[0]), int(div_info[1]))
-        elif line.startswith("Tamaño de cada trozo:"):
-            size_info = line.split(":")[1].strip().split("x")
-            slice_size = (int(size_info[0]), int(size_info[1]))
+        match = _HEADER_RE.match(line)
+        if match:
+            groups = match.groups()
+            if groups[0]:
+                img_dimensions = (int(groups[0]), int(groups[1]))
+            elif groups[2]:
+                division = (int(groups[2]), int(groups[3]))
+            else:
+                slice_size = (int(groups[4]), int(groups[5]))
+        if img_dimensions and division and slice_size:
+            break
     
     if not all([img_dimensions, division, slice_size]):
         raise ValueError("No se pudo extraer la información necesaria del archivo de orden")
     
-    # Crear imagen vacía para la reconstrucción (altura, ancho, canales)
-    reconstructed = np.zeros((img_dimensions[1], img_dimensions[0], 3), dtype=np.uint8)
-    
-    # Directorio donde están los trozos (mismo directorio que el archivo de orden)
-    slices_dir = os.path.dirname(order_file_path)
+    # Contenedor de los trozos, si no se guardaron en archivos sueltos
+    container = None
+    for line in lines:
+        if line.startswith("Contenedor: "):
+            container = line[len("Contenedor: "):].strip()
+            break
+        if line.startswith("Pos.Orig |"):
+            break
     
-    # Leer información de los trozos
+    # Leer la tabla de trozos: Pos.Orig | Archivo Guardado | Fila | Col | Índice Guardado
+    table = []
     start_reading = False
     for line in lines:
-        if line.startswith("Fila | Col"):
+        if line.startswith("Pos.Orig |"):
             start_reading = True
             continue
-        elif start_reading and line.strip() and not line.startswith("-"):
+        elif start_reading:
+            if not line.strip():
+                break  # Fin de la tabla
+            if line.startswith("-"):
+                continue
             parts = [part.strip() for part in line.split("|")]
-            if len(parts) >= 4:
-                row = int(parts[0])
-                col = int(parts[1])
-                filename = parts[3]
-                
-                # Cargar el trozo
-                slice_path = os.path.join(slices_dir, filename)
-                if os.path.exists(slice_path):
-                    slice_img = cv2.imread(slice_path)
-                    
-                    if slice_img is not None:
-                        # Calcular posición en la imagen reconstruida
-                        x = col * slice_size[0]
-                        y = row * slice_size[1]
-                        
-                        # Obtener dimensiones del trozo
-                        slice_height, slice_width = slice_img.shape[:2]
-                        
-                        # Pegar el trozo en la posición correcta
-                        reconstructed[y:y+slice_height, x:x+slice_width] = slice_img
-                    else:
-                        print(f"Advertencia: No se pudo cargar la imagen {filename}")
-                else:
-                    print(f"Advertencia: No se encontró el archivo {filename}")
-    
-    # Guardar imagen reconstruida
-    cv2.imwrite(output_path, reconstructed)
+            if len(parts) >= 5:
+                table.append((int(parts[0]), parts[1], int(parts[4])))
+    
+    rows, cols = division
+    slice_width, slice_height = slice_size
+    return rows, cols, slice_width, slice_height, table, container
+
+
+def reconstruct_image(order_file_path, output_path="reconstructed_image.png"):
+    """
+    Recompone una imagen a partir del archivo de orden.
+    
+    Args:
+        order_file_path (str): Ruta al archivo de orden .txt (o a su copia .json)
+        output_path (str): Ruta donde guardar la imagen reconstruida
+    """
+    # Si existe la copia JSON del archivo de orden, se lee directamente
+    json_path = os.path.splitext(order_file_path)[0] + ".json"
+    if os.path.exists(json_path):
+        rows, cols, slice_width, slice_height, table, container = _read_order_json(json_path)
+    else:
+        rows, cols, slice_width, slice_height, table, container = _read_order_txt(order_file_path)
+    
+    # Directorio donde están los trozos (mismo directorio que el archivo de orden)
+    slices_dir = os.path.dirname(order_file_path)
+    
+    if len(table) != rows * cols:
+        raise ValueError(f"El archivo de orden describe {len(table)} trozos, se esperaban {rows * cols}")
+    
+    table.sort()
+    
+    # Trozos guardados en el contenedor único que indica el archivo de orden
+    if container:
+        container_path = os.path.join(slices_dir, container)
+        if not os.path.exists(container_path):
+            raise FileNotFoundError(f"No se encontró el contenedor de trozos: {container_path}")
+        saved_tiles = _read_container(container_path)
+        if saved_tiles.shape[1:3] != (slice_height, slice_width):
+            raise ValueError(f"Los trozos de {container_path} no miden {slice_width}x{slice_height}")
+        saved_indices = [saved_index for _, _, saved_index in table]
+        if rows * slice_height * cols * slice_width * 3 > RECONSTRUCT_MEMMAP_BYTES:
+            # Sin la copia reordenada ni la transpuesta: cada trozo va directo al lienzo mapeado
+            names = [f"{container}[{saved_index}]" for saved_index in saved_indices]
+            _reconstruct_memmap(saved_indices, names, saved_tiles.__getitem__,
+                                rows, cols, slice_width, slice_height, output_path)
+        else:
+            _write_reconstructed(saved_tiles[saved_indices], rows, cols, slice_width, slice_height, output_path)
+        print(f"✓ Imagen reconstruida guardada en: {output_path}")
+        return
+    
+    filenames = [filename for _, filename, _ in table]
+    slice_paths = [os.path.join(slices_dir, filename) for filename in filenames]
+    read_slice = functools.partial(_read_slice, shape=(slice_height, slice_width))
+    
+    if rows * slice_height * cols * slice_width * 3 > RECONSTRUCT_MEMMAP_BYTES:
+        _reconstruct_memmap(slice_paths, filenames, read_slice, rows, cols, slice_width, slice_height, output_path)
+        print(f"✓ Imagen reconstruida guardada en: {output_path}")
+        return
+    
+    # Lienzo preasignado visto como (fila, alto, col, ancho, 3): cada trozo se
+    # copia una sola vez a su sitio, sin apilarlos antes ni transponer después.
+    # Los que no se puedan cargar quedan en negro.
+    canvas = np.zeros((rows, slice_height, cols, slice_width, 3), dtype=np.uint8)
+    
+    # Cargar los trozos ordenados por posición original. La decodificación PNG
+    # de OpenCV libera el GIL, así que se hace en paralelo; cada trozo se suelta
+    # en cuanto se ha copiado al lienzo.
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        for position, (filename, slice_img) in enumerate(zip(filenames, executor.map(read_slice, slice_paths))):
+            if slice_img is None or slice_img.shape[:2] != (slice_height, slice_width):
+                print(f"Advertencia: No se pudo cargar la imagen {filename}")
+                continue
+            canvas[position // cols, :, position % cols] = slice_img
+    
+    # Guardar imagen reconstruida (codificación rápida según la extensión)
+    reconstructed = canvas.reshape(rows * slice_height, cols * slice_width, 3)
+    cv2.imwrite(output_path, reconstructed, _imwrite_params(output_path))
     print(f"✓ Imagen reconstruida guardada en: {output_path}")
 
 
+def _write_reconstructed(stacked, rows, cols, slice_width, slice_height, output_path):
+    """Compone y guarda la imagen a partir de los trozos (rows*cols, h, w, 3) ordenados por posición."""
+    # Colocar todos los trozos con una única permutación de ejes:
+    # (rows*cols, h, w, 3) -> (rows, h, cols, w, 3) -> (rows*h, cols*w, 3)
+    reconstructed = (stacked
+                     .reshape(rows, cols, slice_height, slice_width, 3)
+                     .transpose(0, 2, 1, 3, 4)
+                     .reshape(rows * slice_height, cols * slice_width, 3))
+    
+    # Guardar imagen reconstruida (codificación rápida según la extensión)
+    cv2.imwrite(output_path, reconstructed, _imwrite_params(output_path))
+
+
+def _reconstruct_memmap(keys, names, read_slice, rows, cols, slice_width, slice_height, output_path):
+    """
+    Recompone imágenes más grandes que RECONSTRUCT_MEMMAP_BYTES sin tenerlas
+    enteras en RAM: el lienzo es un np.memmap junto a output_path y cada fila
+    de trozos se obtiene en paralelo con read_slice(keys[i]) (rutas de los
+    archivos o índices de un contenedor, con names para los avisos) y se
+    copia a su sitio. Para .tif/.tiff se usa
+    tifffile (BigTIFF) si está instalado; si no, se codifica con OpenCV
+    leyendo directamente del archivo mapeado.
+    """
+    try:
+        import tifffile
+    except ImportError:
+        tifffile = None
+    as_tiff = tifffile is not None and output_path.lower().endswith(('.tif', '.tiff'))
+    
+    raw_path = output_path + ".raw"
+    canvas = np.memmap(raw_path, dtype=np.uint8, mode="w+",
+                       shape=(rows * slice_height, cols * slice_width, 3))
+    try:
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for row in range(rows):
+                row_keys = keys[row * cols:(row + 1) * cols]
+                for col, slice_img in enumerate(executor.map(read_slice, row_keys)):
+                    if slice_img is None or slice_img.shape[:2] != (slice_height, slice_width):
+                        print(f"Advertencia: No se pudo cargar la imagen {names[row * cols + col]}")
+                        continue  # El memmap nuevo ya está a cero (negro)
+                    if as_tiff:
+                        slice_img = cv2.cvtColor(slice_img, cv2.COLOR_BGR2RGB)  # TIFF guarda RGB
+                    canvas[row * slice_height:(row + 1) * slice_height,
+                           col * slice_width:(col + 1) * slice_width] = slice_img
+        canvas.flush()
+        
+        if as_tiff:
+            tifffile.imwrite(output_path, canvas, bigtiff=True, photometric='rgb')
+        else:
+            cv2.imwrite(output_path, canvas, _imwrite_params(output_path))
+    finally:
+        del canvas
+        os.remove(raw_path)
+
+
 def main():
     parser = argparse.ArgumentParser(description='Dividir y recomponer imágenes en trozos')
     parser.add_argument('action', choices=['slice', 'reconstruct'], 
@@ -225,6 +699,14 @@ def main():
                        help='Número de trozos (solo para slice, debe tener raíz cuadrada exacta)')
     parser.add_argument('-o', '--output', 
                        help='Directorio de salida (para slice) o archivo de imagen (para reconstruct)')
+    parser.add_argument('-f', '--format', choices=['png', 'jpg', 'bin'], default='png',
+                       help='Formato de los trozos (solo para slice con contenedor png o pack, default: png)')
+    parser.add_argument('-c', '--container', choices=['png', 'npz', 'tif', 'pack'], default='png',
+                       help='Un archivo por trozo (png) o todos en un único archivo npz/tif/pack '
+                            '(solo para slice; los solvers necesitan png)')
+    parser.add_argument('--drop-cache', action='store_true',
+                       help='Descartar los trozos de la caché de páginas tras escribirlos (solo para slice; '
+                            'requiere posix_fadvise, no disponible en Windows ni macOS)')
     
     args = parser.parse_args()
     
@@ -235,7 +717,8 @@ def main():
                 return
             
             output_dir = args.output if args.output else "sliced_images"
-            slice_image(args.input_path, args.num_slices, output_dir)
+            slice_image(args.input_path, args.num_slices, output_dir, args.format, args.container,
+                        args.drop_cache)
             
         elif args.action == 'reconstruct':
             output_path = args.output if args.output else "reconstructed_image.png"